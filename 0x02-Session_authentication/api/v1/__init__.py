@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+""" API v1
+IMPORT_START is the time its import started, for the startup report
+"""
+from time import perf_counter
+
+IMPORT_START = perf_counter()
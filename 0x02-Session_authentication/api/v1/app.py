@@ -3,10 +3,18 @@
 Route module for the API
 """
 from os import getenv
-from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from api.v1 import IMPORT_START, perf
+from api.v1.compress import compress_response
+from api.v1.views import STARTUP, app_views, load_store, store_ready
+from flask import Flask, jsonify, abort, g, request
 from flask_cors import (CORS, cross_origin)
+from models.base import Base
+from models.user import User
+from threading import Thread, current_thread, main_thread
+from time import perf_counter
 import os
+import signal
+import sys
 
 
 app = Flask(__name__)
@@ -23,10 +31,39 @@ elif getenv('AUTH_TYPE') == 'session_auth':
 elif getenv('AUTH_TYPE') == 'session_exp_auth':
     from api.v1.auth.session_exp_auth import SessionExpAuth
     auth = SessionExpAuth()
+elif getenv('AUTH_TYPE') == 'session_token_auth':
+    from api.v1.auth.session_token_auth import SessionTokenAuth
+    auth = SessionTokenAuth()
+elif getenv('AUTH_TYPE') == 'session_db_auth':
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    auth = SessionDBAuth()
 else:
     from api.v1.auth.auth import Auth
     auth = Auth()
 
+perf.instrument(Base, 'search', 'store.search')
+perf.instrument(Base, 'save_to_file', 'store.save_to_file')
+perf.instrument(User, 'is_valid_password', 'password_hash')
+
+
+def terminate(signum, frame) -> None:
+    """
+    Exits normally on SIGTERM, so the batched writes are flushed
+    by the atexit handler of models.base.
+    """
+    sys.exit(0)
+
+
+if current_thread() is main_thread() and \
+        signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, terminate)
+
+STARTUP['import_ms'] = (perf_counter() - IMPORT_START) * 1000
+sys.stderr.write("API imported in {:.1f} ms, loading the store\n".format(
+    STARTUP['import_ms']))
+Thread(target=load_store, args=(auth,), name='store-warm-up',
+       daemon=True).start()
+
 
 @app.before_request
 def before_request() -> None:
@@ -36,18 +73,48 @@ def before_request() -> None:
     """
     excluded_paths = [
             '/api/v1/status/',
+            '/api/v1/ready/',
             '/api/v1/unauthorized/',
             '/api/v1/forbidden/',
             '/api/v1/auth_session/login/'
             ]
+    if not store_ready.is_set() and \
+            request.path.rstrip('/') not in ('/api/v1/status',
+                                             '/api/v1/ready'):
+        abort(503)
+    timer = perf.start_request()
     if auth:
-        if auth.require_auth(request.path, excluded_paths):
-            if not auth.authorization_header(request)\
-                    and not auth.session_cookie(request):
+        with timer.phase('require_auth'):
+            required = auth.require_auth(request.path, excluded_paths)
+        if required:
+            with timer.phase('header'):
+                credentials = auth.authorization_header(request)\
+                    or auth.session_cookie(request)
+            if not credentials:
+                perf.incr('auth.401')
                 abort(401)
-            if not auth.current_user(request):
+            with timer.phase('current_user'):
+                request.current_user = auth.current_user(request)
+            if not request.current_user:
+                perf.incr('auth.403')
                 abort(403)
-            request.current_user = auth.current_user(request)
+            perf.incr('auth.ok')
+    timer.start_view()
+
+
+@app.after_request
+def after_request(response):
+    """
+    Records the request timings and adds the Server-Timing header.
+    """
+    timer = g.get('perf_timer')
+    if timer is None:
+        return response
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return timer.end(response, '{} {}'.format(request.method, rule))
+
+
+app.after_request(compress_response)
 
 
 @app.errorhandler(404)
@@ -65,6 +132,14 @@ def unauthorized(error) -> str:
     return jsonify({"error": "Unauthorized"}), 401
 
 
+@app.errorhandler(503)
+def unavailable(error) -> str:
+    """
+    Request received while the store is still loading
+    """
+    return jsonify({"error": "Service Unavailable"}), 503
+
+
 @app.errorhandler(403)
 def unallowed(error) -> str:
     """
@@ -75,6 +150,9 @@ def unallowed(error) -> str:
 
 
 if __name__ == "__main__":
+    # views import "api.v1.app" to reach auth: make it this module
+    # instead of a second copy with its own auth and sessions
+    sys.modules['api.v1.app'] = sys.modules[__name__]
     host = getenv("API_HOST", "0.0.0.0")
     port = getenv("API_PORT", "5000")
     app.run(host=host, port=port)
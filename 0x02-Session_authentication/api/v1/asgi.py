@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the API
+
+Serves the same Flask app (app_views routes and before_request auth)
+from an event loop: connections, keep-alive and request/response bodies
+are handled asynchronously, and only the request handling itself
+(password checks, store lookups and persistence) runs on a bounded
+executor, so idle clients don't hold a thread.
+
+    uvicorn api.v1.asgi:app
+"""
+from api.v1.app import app as flask_app
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import chain
+from os import getenv
+import asyncio
+import sys
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ASGIApp:
+    """
+    Runs a WSGI app behind an ASGI interface
+    """
+    def __init__(self, wsgi_app, workers: int = None):
+        """
+        Initializes the executor running the WSGI app
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='api-worker')
+
+    async def __call__(self, scope, receive, send):
+        """
+        Handles an ASGI connection
+        """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """
+        Answers the startup and shutdown events
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        """
+        Reads the request body, runs the WSGI app on the executor
+        and streams the response back
+        """
+        body = BytesIO()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        environ = self.environ(scope, body)
+        status, headers, chunks, iterable = await loop.run_in_executor(
+            self.executor, self.start, environ)
+        try:
+            await send({'type': 'http.response.start',
+                        'status': status,
+                        'headers': headers})
+            while chunks is not None:
+                chunks, data = await loop.run_in_executor(
+                    self.executor, self.read, chunks)
+                await send({'type': 'http.response.body',
+                            'body': data,
+                            'more_body': chunks is not None})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.executor, iterable.close)
+
+    def start(self, environ: dict):
+        """
+        Calls the WSGI app, returning the status, the headers,
+        an iterator on the body and the iterable to close
+        """
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'),
+                                    value.encode('latin-1'))
+                                   for name, value in headers]
+            return written.append
+
+        iterable = self.wsgi_app(environ, start_response)
+        chunks = iter(iterable)
+        if not response:
+            # start_response is allowed to be called on the first chunk
+            chunks = chain([next(chunks, b'')], chunks)
+        if written:
+            chunks = chain(written, chunks)
+        return response['status'], response['headers'], chunks, iterable
+
+    @staticmethod
+    def read(chunks):
+        """
+        Reads about CHUNK_SIZE bytes of body. Returns
+        (None, data) once the body is exhausted
+        """
+        data = []
+        size = 0
+        for chunk in chunks:
+            data.append(chunk)
+            size += len(chunk)
+            if size >= CHUNK_SIZE:
+                return chunks, b''.join(data)
+        return None, b''.join(data)
+
+    @staticmethod
+    def environ(scope: dict, body: BytesIO) -> dict:
+        """
+        Builds the WSGI environ of an ASGI HTTP scope
+        """
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode(
+                'latin-1'),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(
+                scope.get('http_version', '1.1')),
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = 'HTTP_' + name
+            if key in environ:
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                value = environ[key] + separator + value
+            environ[key] = value
+        # the body is already buffered: give its length, a chunked
+        # body has no Content-Length and would be read as empty
+        environ['CONTENT_LENGTH'] = str(len(body.getbuffer()))
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+        return environ
+
+
+workers = getenv('ASGI_WORKERS')
+app = ASGIApp(flask_app, int(workers) if workers else None)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    host = getenv("API_HOST", "0.0.0.0")
+    port = getenv("API_PORT", "5000")
+    uvicorn.run(app, host=host, port=int(port))
@@ -40,6 +40,12 @@ class Auth:
         """
         return None
 
+    def stats(self) -> dict:
+        """
+        Counters of the authentication (sessions, caches).
+        """
+        return {}
+
     def session_cookie(self, request=None):
         """
         Return the value of the cookie named _my_session_id from request.
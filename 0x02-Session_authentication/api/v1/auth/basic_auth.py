@@ -4,14 +4,145 @@ Module basic_auth
 """
 from api.v1.auth.auth import Auth
 from base64 import b64decode
+from collections import OrderedDict
+from hashlib import sha256
 from models.user import User
-from typing import TypeVar
+from os import getenv
+from threading import Lock
+from typing import Optional, TypeVar
+import time
+
+
+class FailedCredentialsCache:
+    """
+    Bounded LRU cache of the digests of Authorization headers
+    that recently failed to authenticate.
+    Entries expire after ttl seconds, which bounds how long a user
+    created or updated by another process is still rejected here.
+    Every invalidation bumps a generation: a lookup takes it before
+    searching the users and passes it to add, which skips the digest
+    if an invalidation ran meanwhile.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        """
+        Initializes an empty cache holding at most max_size digests.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._digests = OrderedDict()
+        self._by_email = {}
+        self._lock = Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, digest: str) -> bool:
+        """
+        Returns True if the digest is a cached failure.
+        """
+        with self._lock:
+            entry = self._digests.get(digest)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._digests[digest]
+                self._discard_index(entry[0], digest)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False
+            self._digests.move_to_end(digest)
+            self.hits += 1
+            return True
+
+    def generation(self) -> int:
+        """
+        Number of invalidations so far, to pass to add.
+        """
+        return self._generation
+
+    def add(self, digest: str, email: str,
+            generation: Optional[int] = None) -> None:
+        """
+        Caches a failed digest for the given email, unless generation
+        (taken before the lookup) is no longer the current one.
+        """
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._digests[digest] = (email, time.monotonic() + self.ttl)
+            self._digests.move_to_end(digest)
+            self._by_email.setdefault(email, set()).add(digest)
+            while len(self._digests) > self.max_size:
+                old_digest, old_entry = self._digests.popitem(last=False)
+                self._discard_index(old_entry[0], old_digest)
+
+    def invalidate(self, email: str) -> None:
+        """
+        Forgets every cached failure for the given email.
+        """
+        with self._lock:
+            self._generation += 1
+            for digest in self._by_email.pop(email, ()):
+                self._digests.pop(digest, None)
+
+    def _discard_index(self, email: str, digest: str) -> None:
+        """
+        Removes a digest from the email index.
+        """
+        digests = self._by_email.get(email)
+        if digests is None:
+            return
+        digests.discard(digest)
+        if not digests:
+            del self._by_email[email]
+
+    def stats(self) -> dict:
+        """
+        Size, hits and misses of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self._digests), 'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self) -> int:
+        """
+        Number of cached failures.
+        """
+        return len(self._digests)
 
 
 class BasicAuth(Auth):
     """
     Inherits from Auth
     """
+    def __init__(self):
+        """
+        Initializes the negative cache of failed credentials.
+        The size is read from BASIC_AUTH_FAILED_CACHE_SIZE (0 disables it)
+        and the lifetime of an entry from BASIC_AUTH_FAILED_CACHE_TTL
+        in seconds (60 by default).
+        The cache listens to credentials changes through a weak
+        reference, so it is freed with the instance.
+        """
+        try:
+            size = int(getenv('BASIC_AUTH_FAILED_CACHE_SIZE', '1024'))
+        except ValueError:
+            size = 1024
+        try:
+            ttl = float(getenv('BASIC_AUTH_FAILED_CACHE_TTL', '60'))
+        except ValueError:
+            ttl = 60
+        self.failed_credentials = FailedCredentialsCache(size, ttl)
+        User.add_credentials_listener(self.failed_credentials.invalidate)
+
+    def stats(self) -> dict:
+        """
+        Counters of the failed credentials cache.
+        """
+        return {'failed_credentials_cache': self.failed_credentials.stats()}
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         """
@@ -74,9 +205,17 @@ class BasicAuth(Auth):
         Overloads Auth and retrieves the User instance for a request.
         """
         header = self.authorization_header(request)
+        if header is None:
+            return None
+        digest = sha256(header.encode()).hexdigest()
+        if digest in self.failed_credentials:
+            return None
         base64 = self.extract_base64_authorization_header(header)
         decoded = self.decode_base64_authorization_header(base64)
         credentials = self.extract_user_credentials(decoded)
-        user = user = self.user_object_from_credentials(*credentials)
+        generation = self.failed_credentials.generation()
+        user = self.user_object_from_credentials(*credentials)
+        if user is None and credentials[0]:
+            self.failed_credentials.add(digest, credentials[0], generation)
 
         return user
@@ -3,6 +3,8 @@
 Module session_auth
 """
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import session_store_from_env
+from threading import Lock
 import uuid
 from models.user import User
 
@@ -11,7 +13,31 @@ class SessionAuth(Auth):
     """
     Session authentication.
     """
-    user_id_by_session_id = {}
+    session_ttl = None
+
+    def __init__(self):
+        """
+        Initializes the session store selected by SESSION_STORE.
+        """
+        self.store = session_store_from_env()
+        self._init_counters()
+
+    def _init_counters(self) -> None:
+        """
+        Initializes the created and destroyed session counters.
+        """
+        self.sessions_created = 0
+        self.sessions_destroyed = 0
+        self._counters_lock = Lock()
+
+    def _count(self, created: int = 0, destroyed: int = 0) -> None:
+        """
+        Adds to the session counters, under a lock since requests
+        run on several threads.
+        """
+        with self._counters_lock:
+            self.sessions_created += created
+            self.sessions_destroyed += destroyed
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -20,7 +46,8 @@ class SessionAuth(Auth):
         if user_id is None or type(user_id) is not str:
             return None
         session_id = str(uuid.uuid4())
-        self.user_id_by_session_id[session_id] = user_id
+        self.store.set(session_id, user_id, self.session_ttl)
+        self._count(created=1)
 
         return session_id
 
@@ -30,7 +57,7 @@ class SessionAuth(Auth):
         """
         if session_id is None or type(session_id) is not str:
             return None
-        return self.user_id_by_session_id.get(session_id)
+        return self.store.get(session_id)
 
     def current_user(self, request=None):
         """
@@ -48,9 +75,19 @@ class SessionAuth(Auth):
             return False
 
         cookie = self.session_cookie(request)
-        if cookie is None or\
-                self.user_id_for_session_id(cookie) is None:
+        if cookie is None or type(cookie) is not str:
             return False
 
-        del self.user_id_by_session_id[cookie]
+        if not self.store.delete(cookie):
+            return False
+        self._count(destroyed=1)
         return True
+
+    def stats(self) -> dict:
+        """
+        Counters of the sessions.
+        """
+        stats = self.store.stats()
+        stats['created'] = self.sessions_created
+        stats['destroyed'] = self.sessions_destroyed
+        return {'sessions': stats}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Session authentication persisted with the UserSession model.
+"""
+from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_exp_auth import session_duration_from_env
+from api.v1.auth.session_exp_auth import sweep_interval_from_env
+from api.v1.auth.session_store import SweeperMixin
+from datetime import datetime, timedelta
+from models.base import DATA, TIMESTAMP_FORMAT
+from models.user_session import UserSession
+import uuid
+
+
+class SessionDBAuth(SessionAuth, SweeperMixin):
+    """
+    Session authentication whose sessions survive restarts.
+    Sessions live in the UserSession objects only, no session store
+    is used. When SESSION_DURATION is set, the expired sessions are
+    removed every SESSION_SWEEP_INTERVAL seconds.
+    Session writes are batched (see UserSession.flush_delay) and
+    flushed at exit; the API turns SIGTERM into a normal exit so
+    they aren't lost, a SIGKILL loses the last batch.
+    """
+    SWEEP_BATCH = 500
+
+    def __init__(self):
+        """
+        Reads the duration and sweep interval. The sessions are loaded
+        by load_sessions, from the store warm-up of the API.
+        """
+        # no super().__init__(): it would open a session store
+        self._init_counters()
+        self.session_duration = session_duration_from_env()
+        self.sweep_interval = sweep_interval_from_env()
+
+    def load_sessions(self) -> None:
+        """
+        Loads the sessions that haven't expired and starts the sweeper.
+        """
+        if self.session_duration <= 0:
+            UserSession.load_from_file()
+            return
+        cutoff = (datetime.utcnow() - timedelta(
+            seconds=self.session_duration)).strftime(TIMESTAMP_FORMAT)
+        UserSession.load_from_file(
+            lambda obj_json: obj_json.get('created_at', '') > cutoff)
+        self.start_sweeper(self.sweep_interval)
+
+    def sweep(self) -> int:
+        """
+        Removes the expired sessions with a single write to file and
+        returns how many were removed. The sessions are ordered by
+        creation time, so only the expired ones are visited.
+        """
+        if self.session_duration <= 0 or \
+                UserSession.__name__ not in DATA:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.session_duration)
+        expired = []
+        after = None
+        while True:
+            user_sessions, after = UserSession.page(after, self.SWEEP_BATCH)
+            page = [user_session.id for user_session in user_sessions
+                    if user_session.created_at < cutoff]
+            expired.extend(page)
+            if after is None or len(page) < len(user_sessions):
+                break
+        return len(UserSession.remove_many(expired))
+
+    def create_session(self, user_id=None):
+        """
+        Creates and stores a UserSession.
+        """
+        if user_id is None or type(user_id) is not str:
+            return None
+        session_id = str(uuid.uuid4())
+        UserSession(user_id=user_id, session_id=session_id).save()
+        self._count(created=1)
+        return session_id
+
+    def user_id_for_session_id(self, session_id=None):
+        """
+        Returns the User ID of a stored, unexpired session.
+        Expired sessions are removed.
+        """
+        if session_id is None or type(session_id) is not str:
+            return None
+        user_session = UserSession.get(session_id)
+        if user_session is None:
+            return None
+        if self.session_duration > 0 and \
+                user_session.created_at + timedelta(
+                    seconds=self.session_duration) < datetime.utcnow():
+            user_session.remove()
+            return None
+        return user_session.user_id
+
+    def destroy_session(self, request=None):
+        """
+        Deletes the UserSession of the request / logout.
+        """
+        if request is None:
+            return False
+        session_id = self.session_cookie(request)
+        if session_id is None or type(session_id) is not str:
+            return False
+        user_session = UserSession.get(session_id)
+        if user_session is None:
+            return False
+        user_session.remove()
+        self._count(destroyed=1)
+        return True
+
+    def stats(self) -> dict:
+        """
+        Counters of the persisted sessions.
+        """
+        return {'sessions': {'sessions': UserSession.count(),
+                             'created': self.sessions_created,
+                             'destroyed': self.sessions_destroyed}}
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Session stores used by the session authentication classes.
+"""
+from collections import OrderedDict
+from os import getenv
+from threading import Event, Lock, Thread
+from typing import Optional
+import heapq
+import sqlite3
+import time
+import zlib
+
+
+class SweeperMixin:
+    """
+    Runs the sweep method of the class on a daemon thread.
+    """
+    def sweep(self) -> int:
+        """
+        Deletes the expired sessions and returns how many were deleted.
+        """
+        return 0
+
+    def start_sweeper(self, interval: float = 5) -> None:
+        """
+        Runs sweep every interval seconds on a daemon thread.
+        """
+        if getattr(self, '_sweeper', None) is not None:
+            return
+        stop = self._sweeper = Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.sweep()
+
+        Thread(target=run, name='session-sweeper', daemon=True).start()
+
+    def stop_sweeper(self) -> None:
+        """
+        Stops the sweeper thread.
+        """
+        if getattr(self, '_sweeper', None) is not None:
+            self._sweeper.set()
+            self._sweeper = None
+
+
+class SessionStore(SweeperMixin):
+    """
+    Maps a Session ID to a User ID.
+    """
+    def set(self, session_id: str, user_id: str,
+            ttl: Optional[int] = None) -> None:
+        """
+        Stores user_id for session_id, expiring after ttl seconds
+        (never if ttl is None or <= 0).
+        """
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[str]:
+        """
+        Returns the User ID of a live session, None otherwise.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Deletes a session. Returns True if it existed.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """
+        Counters of the store.
+        """
+        return {'sessions': len(self)}
+
+    def __len__(self) -> int:
+        """
+        Number of stored sessions.
+        """
+        raise NotImplementedError
+
+
+class SessionRecord:
+    """
+    Compact session entry. Timestamps are monotonic milliseconds,
+    expires_at is None for sessions that never expire.
+    """
+    __slots__ = ('user_id', 'created_at', 'expires_at')
+
+    def __init__(self, user_id: str, created_at: int,
+                 expires_at: Optional[int] = None):
+        """
+        Initializes the record.
+        """
+        self.user_id = user_id
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+
+def monotonic_ms() -> int:
+    """
+    Current monotonic time in milliseconds.
+    """
+    return time.monotonic_ns() // 1000000
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-memory store split in lock-striped shards.
+    Each shard is an LRU capped to its share of max_size, plus a
+    min-heap of expiry times that the sweeper pops expired sessions from.
+    With max_size <= 0 nothing is evicted: entries only leave the
+    store when deleted or expired.
+    """
+    def __init__(self, shards: int = 16, max_size: int = 100000):
+        """
+        Initializes the shards.
+        """
+        self.shards = max(1, shards)
+        self.shard_size = max(1, max_size // self.shards) \
+            if max_size > 0 else None
+        self._locks = [Lock() for _ in range(self.shards)]
+        self._entries = [OrderedDict() for _ in range(self.shards)]
+        self._heaps = [[] for _ in range(self.shards)]
+        self._evicted = [0] * self.shards
+        self._expired = [0] * self.shards
+
+    def _shard(self, session_id: str) -> int:
+        """
+        Index of the shard holding session_id.
+        """
+        return zlib.crc32(session_id.encode()) % self.shards
+
+    def set(self, session_id, user_id, ttl=None):
+        """
+        Stores a session, evicting the least recently used ones
+        of the shard when it is full.
+        """
+        now = monotonic_ms()
+        expires_at = now + int(ttl * 1000) if ttl and ttl > 0 else None
+        record = SessionRecord(user_id, now, expires_at)
+        i = self._shard(session_id)
+        entries = self._entries[i]
+        with self._locks[i]:
+            entries[session_id] = record
+            entries.move_to_end(session_id)
+            while self.shard_size is not None and \
+                    len(entries) > self.shard_size:
+                entries.popitem(last=False)
+                self._evicted[i] += 1
+            if expires_at is not None:
+                heapq.heappush(self._heaps[i], (expires_at, session_id))
+
+    def get(self, session_id):
+        """
+        Returns the User ID of a live session and marks it as recently used.
+        """
+        i = self._shard(session_id)
+        entries = self._entries[i]
+        with self._locks[i]:
+            record = entries.get(session_id)
+            if record is None:
+                return None
+            if record.expires_at is not None and \
+                    record.expires_at <= monotonic_ms():
+                del entries[session_id]
+                self._expired[i] += 1
+                return None
+            entries.move_to_end(session_id)
+            return record.user_id
+
+    def delete(self, session_id):
+        """
+        Deletes a session. Its heap entry is dropped by the next sweep.
+        """
+        i = self._shard(session_id)
+        with self._locks[i]:
+            return self._entries[i].pop(session_id, None) is not None
+
+    def sweep(self):
+        """
+        Pops the expired sessions from every shard heap and rebuilds
+        the heaps that mostly hold deleted or evicted sessions.
+        """
+        removed = 0
+        for i in range(self.shards):
+            entries = self._entries[i]
+            with self._locks[i]:
+                heap = self._heaps[i]
+                now = monotonic_ms()
+                while heap and heap[0][0] <= now:
+                    expires_at, session_id = heapq.heappop(heap)
+                    record = entries.get(session_id)
+                    if record is not None and record.expires_at == expires_at:
+                        del entries[session_id]
+                        self._expired[i] += 1
+                        removed += 1
+                if len(heap) > 2 * len(entries) + 64:
+                    heap[:] = [(r.expires_at, sid)
+                               for sid, r in entries.items()
+                               if r.expires_at is not None]
+                    heapq.heapify(heap)
+        return removed
+
+    def stats(self):
+        """
+        Live sessions, and sessions evicted or expired so far.
+        Each shard counts under its own lock, the totals are summed here.
+        """
+        return {'sessions': len(self), 'evicted': sum(self._evicted),
+                'expired': sum(self._expired)}
+
+    def __len__(self):
+        """
+        Number of stored sessions.
+        """
+        return sum(len(entries) for entries in self._entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store persisted in a SQLite file, so sessions survive restarts
+    and are shared by the workers of the same host.
+    """
+    COUNT_TTL = 5
+
+    def __init__(self, path: str = '.db_sessions.sqlite3'):
+        """
+        Opens the database and creates the sessions table.
+        """
+        self.path = path
+        self._lock = Lock()
+        self._count = None
+        self._counted_at = 0
+        self._conn = sqlite3.connect(path, timeout=5,
+                                     check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                           'session_id TEXT PRIMARY KEY, '
+                           'user_id TEXT NOT NULL, '
+                           'expires_at REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS '
+                           'sessions_expires_at ON sessions (expires_at)')
+
+    def set(self, session_id, user_id, ttl=None):
+        """
+        Stores a session. Wall clock is used since the expiry
+        has to be valid for other processes.
+        """
+        expires_at = time.time() + ttl if ttl and ttl > 0 else None
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO sessions '
+                               '(session_id, user_id, expires_at) '
+                               'VALUES (?, ?, ?)',
+                               (session_id, user_id, expires_at))
+
+    def get(self, session_id):
+        """
+        Returns the User ID of a live session.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT user_id FROM sessions '
+                                     'WHERE session_id = ? AND '
+                                     '(expires_at IS NULL OR expires_at > ?)',
+                                     (session_id, time.time())).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        """
+        Deletes a session.
+        """
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM sessions '
+                                        'WHERE session_id = ?', (session_id,))
+        return cursor.rowcount > 0
+
+    def sweep(self):
+        """
+        Deletes the expired sessions and returns how many were deleted.
+        """
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM sessions '
+                                        'WHERE expires_at <= ?',
+                                        (time.time(),))
+        return cursor.rowcount
+
+    def stats(self):
+        """
+        Number of stored sessions, counted at most every COUNT_TTL
+        seconds since COUNT(*) scans the table.
+        """
+        now = time.monotonic()
+        if self._count is None or now - self._counted_at > self.COUNT_TTL:
+            self._count = len(self)
+            self._counted_at = now
+        return {'sessions': self._count}
+
+    def __len__(self):
+        """
+        Number of stored sessions.
+        """
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions'
+                                      ).fetchone()[0]
+
+
+def session_store_from_env() -> SessionStore:
+    """
+    Builds the store selected by SESSION_STORE ('memory' or 'sqlite').
+    SESSION_STORE_SHARDS, SESSION_STORE_MAX_SIZE and SESSION_STORE_PATH
+    configure it.
+    """
+    if getenv('SESSION_STORE') == 'sqlite':
+        return SQLiteSessionStore(getenv('SESSION_STORE_PATH',
+                                         '.db_sessions.sqlite3'))
+    try:
+        shards = int(getenv('SESSION_STORE_SHARDS', '16'))
+        max_size = int(getenv('SESSION_STORE_MAX_SIZE', '100000'))
+    except ValueError:
+        shards, max_size = 16, 100000
+    return MemorySessionStore(shards, max_size)
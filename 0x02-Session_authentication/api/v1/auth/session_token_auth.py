@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Stateless session authentication with HMAC-signed tokens.
+"""
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_store import MemorySessionStore, SQLiteSessionStore
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from os import getenv
+import hashlib
+import hmac
+import secrets
+import time
+
+
+class SessionTokenAuth(SessionExpAuth):
+    """
+    The Session ID is a signed token
+    "<user_id>.<issued_at>.<nonce>.<signature>", validated without any
+    session lookup. The store only holds the revoked tokens until they
+    would have expired anyway, and never evicts them: an evicted
+    revocation would make a logged out token valid again.
+    With the default in-memory store a logout only applies to the
+    process it was made on; set SESSION_STORE=sqlite to share the
+    revocations between the workers of a host.
+    """
+    default_duration = 86400
+
+    def __init__(self):
+        """
+        Reads the signing key from SESSION_SECRET. Without it a random
+        key is used, and tokens are only valid for this process.
+        Revocations go to an in-memory store without eviction, unless
+        SESSION_STORE=sqlite.
+        """
+        super().__init__()
+        if not isinstance(self.store, SQLiteSessionStore):
+            self.store.stop_sweeper()
+            self.store = MemorySessionStore(self.store.shards, max_size=0)
+        if self.session_duration <= 0:
+            self.session_duration = self.default_duration
+        self.store.start_sweeper(self.sweep_interval)
+        secret = getenv('SESSION_SECRET')
+        if secret:
+            self.secret = secret.encode()
+        else:
+            self.secret = secrets.token_bytes(32)
+
+    def _sign(self, payload: str) -> str:
+        """
+        Returns the base64url HMAC-SHA256 signature of payload.
+        """
+        digest = hmac.new(self.secret, payload.encode(),
+                          hashlib.sha256).digest()
+        return urlsafe_b64encode(digest).decode().rstrip('=')
+
+    def create_session(self, user_id: str = None) -> str:
+        """
+        Creates a signed token for a user_id. The random nonce makes
+        every token unique, even for logins in the same second.
+        """
+        if user_id is None or type(user_id) is not str:
+            return None
+        encoded_id = urlsafe_b64encode(user_id.encode()).decode().rstrip('=')
+        payload = '{}.{}.{}'.format(encoded_id, int(time.time()),
+                                    secrets.token_urlsafe(8))
+        self._count(created=1)
+        return '{}.{}'.format(payload, self._sign(payload))
+
+    def _verify(self, session_id: str):
+        """
+        Returns (user_id, signature, expires_at) of a valid,
+        unexpired token, None otherwise.
+        """
+        if session_id is None or type(session_id) is not str:
+            return None
+        parts = session_id.split('.')
+        if len(parts) != 4:
+            return None
+        encoded_id, issued_at, nonce, signature = parts
+        expected = self._sign('{}.{}.{}'.format(encoded_id, issued_at, nonce))
+        if not hmac.compare_digest(expected, signature):
+            return None
+        try:
+            expires_at = int(issued_at) + self.session_duration
+            padding = '=' * (-len(encoded_id) % 4)
+            user_id = urlsafe_b64decode(encoded_id + padding).decode()
+        except ValueError:
+            return None
+        if expires_at <= time.time():
+            return None
+        return user_id, signature, expires_at
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """
+        Returns the User ID of a valid and not revoked token.
+        """
+        token = self._verify(session_id)
+        if token is None or self.store.get(token[1]) is not None:
+            return None
+        return token[0]
+
+    def destroy_session(self, request=None):
+        """
+        Revokes the token of the request / logout.
+        """
+        if request is None:
+            return False
+        token = self._verify(self.session_cookie(request))
+        if token is None or self.store.get(token[1]) is not None:
+            return False
+        user_id, signature, expires_at = token
+        self.store.set(signature, user_id, expires_at - time.time())
+        self._count(destroyed=1)
+        return True
+
+    def stats(self) -> dict:
+        """
+        Counters of the tokens. Live tokens are not tracked,
+        only the revoked ones still held by the store, as counted
+        by its (cached) stats.
+        """
+        return {'sessions': {'created': self.sessions_created,
+                             'destroyed': self.sessions_destroyed,
+                             'revoked': self.store.stats()['sessions']}}
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+gzip compression of the JSON responses
+"""
+from flask import request
+from itertools import chain
+from os import getenv
+import zlib
+
+
+MIN_SIZE = int(getenv('COMPRESS_MIN_SIZE', '1024'))
+LEVEL = int(getenv('COMPRESS_LEVEL', '6'))
+
+
+def gzip_stream(chunks):
+    """
+    Compresses an iterable of bytes chunk by chunk
+    """
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """
+    gzips a JSON response of at least MIN_SIZE bytes when the client
+    accepts it. A streamed body is only read up to MIN_SIZE bytes to
+    decide, then compressed as it streams.
+    """
+    if response.status_code < 200 or response.status_code in (204, 304) \
+            or 'Content-Encoding' in response.headers:
+        return response
+    mimetype = response.mimetype or ''
+    if mimetype != 'application/json' and not mimetype.endswith('+json'):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= MIN_SIZE:
+                break
+        if size < MIN_SIZE:
+            response.set_data(b''.join(head))
+            return response
+        response.response = gzip_stream(chain(head, chunks))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(b''.join(gzip_stream([data])))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
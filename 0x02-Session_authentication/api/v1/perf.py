@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Lightweight latency histograms and counters for the API.
+Enabled with API_PERF=1, otherwise every helper is a no-op.
+"""
+from flask import g
+from functools import wraps
+from os import getenv
+from time import perf_counter
+from typing import Callable
+
+
+ENABLED = getenv('API_PERF', '0') == '1'
+BUCKETS = 32
+
+
+class Histogram:
+    """
+    Log2 histogram of durations in microseconds.
+    Updates are not locked: under contention a sample may be lost,
+    which is fine for monitoring and keeps the cost to a few adds.
+    """
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        """
+        Initializes empty buckets.
+        """
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        """
+        Adds a duration.
+        """
+        us = int(seconds * 1000000)
+        self.counts[min(us.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p: float) -> float:
+        """
+        Upper bound in milliseconds of the bucket holding percentile p.
+        """
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return (1 << i) / 1000
+        return 0.0
+
+    def to_json(self) -> dict:
+        """
+        Summary of the histogram.
+        """
+        return {
+            'count': self.count,
+            'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+        }
+
+
+PHASES = {}
+ROUTES = {}
+COUNTERS = {}
+
+
+def record(name: str, seconds: float, histograms: dict = PHASES) -> None:
+    """
+    Records a duration in the named histogram.
+    """
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms.setdefault(name, Histogram())
+    histogram.record(seconds)
+
+
+def incr(name: str) -> None:
+    """
+    Increments the named counter.
+    """
+    if ENABLED:
+        COUNTERS[name] = COUNTERS.get(name, 0) + 1
+
+
+class Phase:
+    """
+    Context manager timing a phase of a request.
+    """
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name: str):
+        """
+        Initializes the phase.
+        """
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        """
+        Starts the timer.
+        """
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        """
+        Records the phase for the histograms and the Server-Timing header.
+        """
+        seconds = perf_counter() - self.start
+        record(self.name, seconds)
+        self.timer.timings.append((self.name, seconds))
+
+
+class RequestTimer:
+    """
+    Timings of the current request.
+    """
+    __slots__ = ('start', 'view', 'timings')
+
+    def __init__(self):
+        """
+        Starts timing the request.
+        """
+        self.start = perf_counter()
+        self.view = None
+        self.timings = []
+
+    def phase(self, name: str) -> Phase:
+        """
+        Returns a context manager timing the named phase.
+        """
+        return Phase(self, name)
+
+    def start_view(self) -> None:
+        """
+        Marks the end of before_request.
+        """
+        self.view = perf_counter()
+
+    def end(self, response, route: str):
+        """
+        Records the view and total durations and adds the
+        Server-Timing header to the response.
+        """
+        end = perf_counter()
+        timings = self.timings
+        if self.view is not None:
+            timings.append(('view', end - self.view))
+            record('view', end - self.view)
+        total = end - self.start
+        timings.append(('total', total))
+        record(route, total, ROUTES)
+        response.headers['Server-Timing'] = ', '.join([
+            '%s;dur=%.3f' % (name, seconds * 1000)
+            for name, seconds in timings])
+        return response
+
+
+class NoTimer:
+    """
+    Timer doing nothing, used when disabled.
+    """
+    __slots__ = ()
+
+    def phase(self, name: str):
+        """
+        Returns itself as a context manager doing nothing.
+        """
+        return self
+
+    def __enter__(self):
+        """
+        Does nothing.
+        """
+
+    def __exit__(self, *exc):
+        """
+        Does nothing.
+        """
+
+    def start_view(self) -> None:
+        """
+        Does nothing.
+        """
+
+    def end(self, response, route: str):
+        """
+        Returns the response unchanged.
+        """
+        return response
+
+
+NO_TIMER = NoTimer()
+
+
+def start_request():
+    """
+    Returns the timer of the current request, stored in g.perf_timer.
+    """
+    if not ENABLED:
+        return NO_TIMER
+    timer = g.perf_timer = RequestTimer()
+    return timer
+
+
+def timed(name: str, function: Callable) -> Callable:
+    """
+    Wraps function to count its calls and time them in a histogram.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = perf_counter() - start
+            record(name, seconds)
+            COUNTERS[name] = COUNTERS.get(name, 0) + 1
+            timer = g.get('perf_timer') if g else None
+            if timer is not None:
+                timer.timings.append((name, seconds))
+    return wrapper
+
+
+def instrument(cls: type, attribute: str, name: str) -> None:
+    """
+    Times a method (or classmethod) of cls under name, when enabled.
+    """
+    if not ENABLED:
+        return
+    method = cls.__dict__[attribute]
+    if isinstance(method, classmethod):
+        setattr(cls, attribute, classmethod(timed(name, method.__func__)))
+    else:
+        setattr(cls, attribute, timed(name, method))
+
+
+def snapshot() -> dict:
+    """
+    Returns all histograms and counters.
+    """
+    return {
+        'enabled': ENABLED,
+        'phases': {k: v.to_json() for k, v in list(PHASES.items())},
+        'routes': {k: v.to_json() for k, v in list(ROUTES.items())},
+        'counters': dict(COUNTERS),
+    }
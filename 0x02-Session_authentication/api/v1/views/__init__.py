@@ -2,11 +2,34 @@
 """ DocDocDocDocDocDoc
 """
 from flask import Blueprint
+from threading import Event
+from time import perf_counter
+import sys
+import traceback
 
 app_views = Blueprint("app_views", __name__, url_prefix="/api/v1")
+store_ready = Event()
+STARTUP = {}
 
 from api.v1.views.index import *
 from api.v1.views.users import *
 from api.v1.views.session_auth import *
 
-User.load_from_file()
+
+def load_store(auth=None) -> None:
+    """ Load the stored objects, and the sessions of auth when it
+    keeps them in the store, then mark the store as ready.
+    A failure is logged and kept in STARTUP['error'] for /ready
+    """
+    start = perf_counter()
+    try:
+        User.load_from_file()
+        load_sessions = getattr(auth, 'load_sessions', None)
+        if load_sessions is not None:
+            load_sessions()
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        STARTUP['error'] = "{}: {}".format(type(e).__name__, e)
+        return
+    STARTUP['load_ms'] = (perf_counter() - start) * 1000
+    store_ready.set()
@@ -3,6 +3,7 @@
 """
 from flask import jsonify, abort
 from api.v1.views import app_views
+import re
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -14,18 +15,53 @@ def status() -> str:
     return jsonify({"status": "OK"})
 
 
+@app_views.route('/ready', methods=['GET'], strict_slashes=False)
+def ready() -> str:
+    """ GET /api/v1/ready
+    Return:
+      - 200 once the store is loaded, with the startup durations
+      - 503 while it is loading, or with the error if loading failed
+    """
+    from api.v1.views import STARTUP, store_ready
+    if 'error' in STARTUP:
+        return jsonify({"status": "failed", "error": STARTUP['error']}), 503
+    if not store_ready.is_set():
+        return jsonify({"status": "loading"}), 503
+    return jsonify(dict(STARTUP, status="ready"))
+
+
 @app_views.route('/stats/', strict_slashes=False)
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the store file sizes and last persist durations
+      - the sessions and cache counters of the authentication
+    All values are kept up to date by the writers, nothing is scanned.
     """
-    from models.user import User
+    from api.v1.app import auth
+    from models.base import DATA, PERSIST_STATS
     stats = {}
-    stats['users'] = User.count()
+    for s_class, objs in list(DATA.items()):
+        name = re.sub(r'(?<!^)(?=[A-Z])', '_', s_class).lower()
+        stats[name + 's'] = len(objs)
+    stats['store'] = {s_class: dict(values)
+                      for s_class, values in list(PERSIST_STATS.items())}
+    stats['auth'] = auth.stats() if auth else {}
     return jsonify(stats)
 
 
+@app_views.route('/stats/perf', strict_slashes=False)
+def perf_stats() -> str:
+    """ GET /api/v1/stats/perf
+    Return:
+      - latency histograms per phase and per route, and the counters
+        of auth outcomes and store operations
+    """
+    from api.v1 import perf
+    return jsonify(perf.snapshot())
+
+
 @app_views.route('/unauthorized', strict_slashes=False)
 def unauthorized() -> str:
     """
@@ -2,7 +2,7 @@
 """
 New Flask view that handles all routes for the Session authentication.
 """
-from flask import jsonify, request
+from flask import abort, jsonify, request
 from api.v1.views import app_views
 from os import getenv
 from models.user import User
@@ -2,18 +2,109 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from flask import Response, abort, jsonify, request, url_for
+from models.base import TIMESTAMP_FORMAT
 from models.user import User
+from os import getenv
+import json
+import uuid
+import zlib
+
+
+MAX_PAGE_SIZE = 1000
+BULK_MAX_ITEMS = int(getenv('BULK_MAX_ITEMS', '100000'))
+# User.version() restarts with the process, the epoch keeps the list
+# ETags of two runs apart
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+
+def not_modified(etag: str) -> Response:
+    """ 304 response if If-None-Match matches the weak etag, None otherwise
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def encode_cursor(key: tuple) -> str:
+    """ Opaque cursor of a (created_at, id) key
+    """
+    raw = "{}|{}".format(key[0].strftime(TIMESTAMP_FORMAT), key[1]).encode()
+    return urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """ (created_at, id) key of a cursor, raises ValueError if invalid
+    """
+    raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, obj_id = raw.split('|', 1)
+    created_at = datetime.fromisoformat(created_at)
+    if created_at.tzinfo is not None:
+        raise ValueError("cursor time must be naive UTC")
+    return created_at, obj_id
+
+
+def stream_json_list(objs) -> Response:
+    """ Response streaming the JSON list of objs
+    """
+    def generate():
+        yield '['
+        separator = ''
+        for obj in objs:
+            yield separator + json.dumps(obj.to_json())
+            separator = ','
+        yield ']\n'
+    return Response(generate(), mimetype='application/json')
 
 
 @app_views.route('/users', strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size, up to MAX_PAGE_SIZE
+      - cursor: opaque cursor from the Link header of the previous page
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page
+        ordered by created_at, id with a Link rel="next" header
+      - 400 if limit or cursor is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    etag = "users-{}-{}-{}".format(ETAG_EPOCH, User.version(),
+                                   zlib.crc32(request.query_string))
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        response = stream_json_list(User.all())
+        response.set_etag(etag, weak=True)
+        return response
+
+    try:
+        limit = int(limit) if limit is not None else 100
+    except ValueError:
+        limit = 0
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({'error': "limit must be between 1 and {}".format(
+            MAX_PAGE_SIZE)}), 400
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': "Invalid cursor"}), 400
+
+    users, next_key = User.page(after, limit)
+    response = jsonify([user.to_json() for user in users])
+    if next_key is not None:
+        next_url = url_for('app_views.view_all_users', limit=limit,
+                           cursor=encode_cursor(next_key))
+        response.headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    response.set_etag(etag, weak=True)
+    return response
 
 
 @app_views.route('/users/<user_id>', strict_slashes=False)
@@ -23,18 +114,24 @@ def view_one_user(user_id: str = None) -> str:
       - User ID
     Return:
       - User object JSON represented
+      - 304 if If-None-Match matches the User ETag
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
         abort(404)
-    user = User.get(user_id)
     if user_id == "me":
-        if request.current_user is None:
-            abort(404)
-        return jsonify(request.current_user.to_json())
+        user = getattr(request, 'current_user', None)
+    else:
+        user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = user.etag()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    response = jsonify(user.to_json())
+    response.set_etag(etag, weak=True)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -124,3 +221,110 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def bulk_items():
+    """ Items of a bulk request body: a JSON array, or one JSON value
+    per line with the application/x-ndjson content type.
+    Yields (item, error) pairs, returns None if the body isn't an array
+    """
+    if request.mimetype == 'application/x-ndjson':
+        def parse_lines():
+            for line in request.stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line), None
+                except ValueError:
+                    yield None, "Wrong format"
+        return parse_lines()
+    rj = request.get_json(silent=True)
+    if type(rj) is not list:
+        return None
+    return ((item, None) for item in rj)
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/bulk
+    Body: JSON array (or NDJSON) of objects with:
+      - email
+      - password
+      - last_name (optional)
+      - first_name (optional)
+    Return:
+      - per item status: 201 with the User ID, or 400 with the error.
+        All the created Users are saved with one write
+      - 400 if the body isn't an array
+      - 413 if there are more than BULK_MAX_ITEMS items
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = []
+    for index, (rj, error_msg) in enumerate(items):
+        if index >= BULK_MAX_ITEMS:
+            return jsonify({'error': "Too many items, max {}".format(
+                BULK_MAX_ITEMS)}), 413
+        if error_msg is None and type(rj) is not dict:
+            error_msg = "Wrong format"
+        if error_msg is None and rj.get("email", "") == "":
+            error_msg = "email missing"
+        if error_msg is None and rj.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is None:
+            try:
+                user = User()
+                user.email = rj.get("email")
+                user.password = rj.get("password")
+                user.first_name = rj.get("first_name")
+                user.last_name = rj.get("last_name")
+                users.append(user)
+                results.append({'index': index, 'status': 201,
+                                'id': user.id})
+                continue
+            except Exception as e:
+                error_msg = "Can't create User: {}".format(e)
+        results.append({'index': index, 'status': 400, 'error': error_msg})
+    if users:
+        User.save_many(users)
+    return jsonify({'results': results}), 200
+
+
+@app_views.route('/users/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """ DELETE /api/v1/users/bulk
+    Body: JSON array (or NDJSON) of User IDs
+    Return:
+      - per item status: 200 if deleted, 404 if the User ID doesn't
+        exist, 400 if the item isn't an ID. Deletions are saved
+        with one write
+      - 400 if the body isn't an array
+      - 413 if there are more than BULK_MAX_ITEMS items
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    ids = []
+    for index, (user_id, error_msg) in enumerate(items):
+        if index >= BULK_MAX_ITEMS:
+            return jsonify({'error': "Too many items, max {}".format(
+                BULK_MAX_ITEMS)}), 413
+        if error_msg is None and type(user_id) is not str:
+            error_msg = "Wrong format"
+        ids.append((user_id, error_msg))
+    removed = set(User.remove_many([user_id for user_id, error_msg in ids
+                                    if error_msg is None]))
+    results = []
+    for index, (user_id, error_msg) in enumerate(ids):
+        if error_msg is not None:
+            results.append({'index': index, 'status': 400,
+                            'error': error_msg})
+        elif user_id in removed:
+            results.append({'index': index, 'status': 200, 'id': user_id})
+            removed.discard(user_id)
+        else:
+            results.append({'index': index, 'status': 404, 'id': user_id})
+    return jsonify({'results': results}), 200
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Load test of the API.
+
+Starts the API locally with the chosen AUTH_TYPE on a store seeded
+with N users, drives a mix of requests from concurrent clients and
+reports the RPS and latency percentiles per operation. A chunked
+request body is checked first. Each run is saved as JSON so runs can
+be compared:
+
+    ./loadtest.py --auth-type session_auth --users 10000 --clients 50
+    ./loadtest.py --compare loadtest_results/a.json loadtest_results/b.json
+"""
+from datetime import datetime
+from models.user import User
+from threading import Event, Thread
+from typing import Dict, List
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+
+SESSION_NAME = '_my_session_id'
+SESSION_AUTH_TYPES = ('session_auth', 'session_exp_auth',
+                      'session_token_auth', 'session_db_auth')
+DEFAULT_MIX = 'login=1,me=10,list=2,create=1,update=2'
+
+
+def seed_users(directory: str, count: int) -> None:
+    """
+    Writes the .db_User.json of count users in directory.
+    User i has the email user<i>@load.test and the password pwd<i>.
+    """
+    objs_json = {}
+    for i in range(count):
+        user = User(email='user{}@load.test'.format(i))
+        user.password = 'pwd{}'.format(i)
+        objs_json[user.id] = user.to_json(True)
+    with open(os.path.join(directory, '.db_User.json'), 'w') as f:
+        json.dump(objs_json, f)
+
+
+def start_api(directory: str, auth_type: str, port: int,
+              server: str) -> subprocess.Popen:
+    """
+    Starts the API in directory and waits until it is ready.
+    """
+    env = dict(os.environ, AUTH_TYPE=auth_type, SESSION_NAME=SESSION_NAME,
+               SESSION_DURATION=os.environ.get('SESSION_DURATION', '3600'),
+               API_HOST='127.0.0.1', API_PORT=str(port),
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    module = 'api.v1.asgi' if server == 'asgi' else 'api.v1.app'
+    process = subprocess.Popen([sys.executable, '-m', module], cwd=directory,
+                               env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:{}/api/v1/ready'.format(port)
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError('the API exited with {}'.format(
+                process.returncode))
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == 200:
+                return process
+            if response.json().get('status') == 'failed':
+                process.kill()
+                raise RuntimeError('the API failed to load the store: '
+                                   '{}'.format(response.json()['error']))
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('the API did not start')
+
+
+class Client(Thread):
+    """
+    Client sending random operations of the mix as one user
+    """
+    def __init__(self, base_url: str, auth_type: str, users: int,
+                 mix: List[str], stop: Event):
+        """
+        Initializes the client.
+        """
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.auth_type = auth_type
+        self.mix = mix
+        self.stop = stop
+        self.latencies = {}
+        self.errors = {}
+        self.index = random.randrange(users)
+        self.email = 'user{}@load.test'.format(self.index)
+        self.password = 'pwd{}'.format(self.index)
+        self.user_id = None
+        self.http = requests.Session()
+        if auth_type == 'basic_auth':
+            self.http.auth = (self.email, self.password)
+
+    def request(self, operation: str, method: str, path: str, **kwargs):
+        """
+        Sends a request and records its latency.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path,
+                                         timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response = None
+            ok = False
+        self.latencies.setdefault(operation, []).append(
+            time.perf_counter() - start)
+        if not ok:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        return response
+
+    def login(self):
+        """
+        Logs in (session auth) or checks the credentials (basic auth).
+        """
+        if self.auth_type in SESSION_AUTH_TYPES:
+            response = self.request('login', 'POST', '/auth_session/login',
+                                    data={'email': self.email,
+                                          'password': self.password})
+        else:
+            response = self.request('login', 'GET', '/users/me')
+        if response is not None and response.status_code == 200:
+            self.user_id = response.json().get('id')
+
+    def run(self):
+        """
+        Sends operations until stopped.
+        """
+        self.login()
+        while not self.stop.is_set():
+            operation = random.choice(self.mix)
+            if operation == 'login':
+                self.login()
+            elif operation == 'me':
+                self.request('me', 'GET', '/users/me')
+            elif operation == 'list':
+                self.request('list', 'GET', '/users',
+                             params={'limit': 100})
+            elif operation == 'create':
+                self.request('create', 'POST', '/users',
+                             json={'email': 'new{}@load.test'.format(
+                                 random.getrandbits(64)),
+                                 'password': 'pwd'})
+            elif operation == 'update' and self.user_id:
+                self.request('update', 'PUT', '/users/' + self.user_id,
+                             json={'first_name': str(time.time())})
+
+
+def check_chunked_body(client: Client) -> None:
+    """
+    Sends a chunked NDJSON body (no Content-Length) to /users/bulk and
+    checks every user was created, so servers that drop such bodies
+    fail before the run.
+    """
+    client.login()
+    lines = (json.dumps({'email': 'chunked{}@load.test'.format(
+        random.getrandbits(64)), 'password': 'pwd'}).encode() + b'\n'
+        for _ in range(2))
+    response = client.http.post(
+        client.base_url + '/users/bulk', data=lines, timeout=30,
+        headers={'Content-Type': 'application/x-ndjson'})
+    results = response.json().get('results', []) \
+        if response.status_code == 200 else []
+    if len(results) != 2 or \
+            any(result.get('status') != 201 for result in results):
+        raise RuntimeError('chunked body not read: {} {}'.format(
+            response.status_code, response.text.strip()))
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Percentile p of sorted values, in milliseconds.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))] * 1000
+
+
+def summarize(clients: List[Client], duration: float) -> Dict:
+    """
+    RPS and latency percentiles per operation and overall.
+    """
+    latencies = {}
+    errors = {}
+    for client in clients:
+        for operation, values in client.latencies.items():
+            latencies.setdefault(operation, []).extend(values)
+        for operation, count in client.errors.items():
+            errors[operation] = errors.get(operation, 0) + count
+    latencies['all'] = [v for values in list(latencies.values())
+                        for v in values]
+    errors['all'] = sum(errors.values())
+    summary = {}
+    for operation, values in latencies.items():
+        values.sort()
+        summary[operation] = {
+            'requests': len(values),
+            'errors': errors.get(operation, 0),
+            'rps': len(values) / duration,
+            'p50_ms': percentile(values, 0.5),
+            'p90_ms': percentile(values, 0.9),
+            'p99_ms': percentile(values, 0.99),
+            'max_ms': values[-1] * 1000 if values else 0.0,
+        }
+    return summary
+
+
+def print_summary(summary: Dict) -> None:
+    """
+    Prints a summary as a table.
+    """
+    print('{:<8} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'op', 'requests', 'errors', 'rps', 'p50 ms', 'p90 ms', 'p99 ms',
+        'max ms'))
+    for operation, row in sorted(summary.items()):
+        print('{:<8} {requests:>9} {errors:>7} {rps:>9.1f} {p50_ms:>9.2f} '
+              '{p90_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f}'.format(
+                  operation, **row))
+
+
+def compare(paths: List[str]) -> None:
+    """
+    Prints the RPS and p99 of each operation for several saved runs.
+    """
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.append(json.load(f))
+    operations = sorted({op for run in runs for op in run['results']})
+    names = ['{} n={}'.format(run['config']['auth_type'],
+                              run['config']['users'])[:24] for run in runs]
+    print('{:<8} {}'.format('op', ' '.join(
+        '{:>24}'.format(name) for name in names)))
+    for operation in operations:
+        cells = []
+        for run in runs:
+            row = run['results'].get(operation)
+            cells.append('{:>24}'.format(
+                '{:.1f} rps {:.2f} ms'.format(row['rps'], row['p99_ms'])
+                if row else '-'))
+        print('{:<8} {}'.format(operation, ' '.join(cells)))
+
+
+def parse_mix(mix: str) -> List[str]:
+    """
+    Weighted list of operations of "op=weight,..."
+    """
+    operations = []
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        operations.extend([name.strip()] * int(weight or 1))
+    return operations
+
+
+def main() -> None:
+    """
+    Runs a load test or compares saved runs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--auth-type', default='session_auth')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--server', choices=('flask', 'asgi'),
+                        default='flask')
+    parser.add_argument('--output-dir', default='loadtest_results')
+    parser.add_argument('--compare', nargs='+', metavar='RESULT')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        seed_users(directory, args.users)
+        process = start_api(directory, args.auth_type, args.port,
+                            args.server)
+        try:
+            stop = Event()
+            base_url = 'http://127.0.0.1:{}/api/v1'.format(args.port)
+            mix = parse_mix(args.mix)
+            check_chunked_body(Client(base_url, args.auth_type, args.users,
+                                      mix, stop))
+            clients = [Client(base_url, args.auth_type, args.users, mix,
+                              stop) for _ in range(args.clients)]
+            start = time.perf_counter()
+            for client in clients:
+                client.start()
+            time.sleep(args.duration)
+            stop.set()
+            for client in clients:
+                client.join()
+            duration = time.perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait()
+
+    summary = summarize(clients, duration)
+    print_summary(summary)
+    os.makedirs(args.output_dir, exist_ok=True)
+    result_path = os.path.join(args.output_dir, '{}-{}-{}.json'.format(
+        datetime.utcnow().strftime('%Y%m%dT%H%M%S'), args.auth_type,
+        args.users))
+    with open(result_path, 'w') as f:
+        json.dump({'config': vars(args), 'duration': duration,
+                   'results': summary}, f, indent=2)
+    print('saved', result_path)
+
+
+if __name__ == "__main__":
+    main()
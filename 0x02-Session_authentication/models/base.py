@@ -1,20 +1,32 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
-from typing import TypeVar, List, Iterable
+from threading import Lock, Timer
+from time import perf_counter
+from typing import Callable, TypeVar, List, Iterable, Optional, Tuple
 from os import path
+import atexit
 import json
+import os
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+PENDING_FLUSHES = {}
+FLUSH_LOCK = Lock()
+ORDERED = {}
+VERSIONS = {}
+PERSIST_STATS = {}
+INDEX_LOCK = Lock()
 
 
 class Base():
     """ Base class
     """
+    flush_delay = None
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -57,49 +69,160 @@ class Base():
                 result[key] = value
         return result
 
+    def etag(self) -> str:
+        """ Entity tag of the object, changed by every save
+        """
+        return "{}-{}".format(self.id,
+                              self.updated_at.strftime("%Y%m%d%H%M%S%f"))
+
+    @classmethod
+    def version(cls) -> int:
+        """ Counter changed by every save or remove of the class objects
+        """
+        return VERSIONS.get(cls.__name__, 0)
+
     @classmethod
-    def load_from_file(cls):
+    def load_from_file(cls, keep: Callable[[dict], bool] = None):
         """ Load all objects from file
+        (only the ones whose JSON passes keep, if given)
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         DATA[s_class] = {}
+        ORDERED[s_class] = []
+        VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
         if not path.exists(file_path):
             return
 
+        PERSIST_STATS[s_class] = {'file_size': path.getsize(file_path),
+                                  'last_persist_ms': None, 'persists': 0}
         with open(file_path, 'r') as f:
             objs_json = json.load(f)
             for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+                if keep is None or keep(obj_json):
+                    DATA[s_class][obj_id] = cls(**obj_json)
+        ORDERED[s_class] = sorted(obj.order_key()
+                                  for obj in DATA[s_class].values())
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        start = perf_counter()
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
+        for obj_id, obj in list(DATA[s_class].items()):
             objs_json[obj_id] = obj.to_json(True)
 
-        with open(file_path, 'w') as f:
+        tmp_path = "{}.{}.tmp".format(file_path, uuid.uuid4().hex)
+        with open(tmp_path, 'w') as f:
             json.dump(objs_json, f)
+            file_size = f.tell()
+        os.replace(tmp_path, file_path)
+        stats = PERSIST_STATS.setdefault(s_class, {'persists': 0})
+        stats['file_size'] = file_size
+        stats['last_persist_ms'] = (perf_counter() - start) * 1000
+        stats['persists'] += 1
+
+    @classmethod
+    def persist(cls):
+        """ Save all objects to file, right away or, if flush_delay
+        is set, in one batched write flush_delay seconds later
+        """
+        if cls.flush_delay is None:
+            cls.save_to_file()
+            return
+        with FLUSH_LOCK:
+            if cls in PENDING_FLUSHES:
+                return
+            timer = Timer(cls.flush_delay, cls.flush)
+            timer.daemon = True
+            PENDING_FLUSHES[cls] = timer
+        timer.start()
+
+    @classmethod
+    def flush(cls):
+        """ Write the pending batched changes to file
+        """
+        with FLUSH_LOCK:
+            timer = PENDING_FLUSHES.pop(cls, None)
+        if timer is None:
+            return
+        timer.cancel()
+        cls.save_to_file()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with INDEX_LOCK:
+            if DATA[s_class].get(self.id) is None:
+                insort(ORDERED.setdefault(s_class, []), self.order_key())
+            DATA[s_class][self.id] = self
+            VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+        self.__class__.persist()
+
+    @classmethod
+    def save_many(cls, objs: List[TypeVar('Base')]):
+        """ Save several objects with a single write to file
+        """
+        s_class = cls.__name__
+        now = datetime.utcnow()
+        with INDEX_LOCK:
+            objs_data = DATA.setdefault(s_class, {})
+            keys = ORDERED.setdefault(s_class, [])
+            new_keys = []
+            for obj in objs:
+                obj.updated_at = now
+                if objs_data.get(obj.id) is None:
+                    new_keys.append(obj.order_key())
+                objs_data[obj.id] = obj
+            keys.extend(new_keys)
+            keys.sort()
+            VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+        cls.persist()
+
+    @classmethod
+    def remove_many(cls, ids: List[str]) -> List[str]:
+        """ Remove several objects with a single write to file,
+        returns the IDs that existed
+        """
+        s_class = cls.__name__
+        with INDEX_LOCK:
+            objs_data = DATA.setdefault(s_class, {})
+            removed = [obj_id for obj_id in ids
+                       if objs_data.pop(obj_id, None) is not None]
+            if removed:
+                removed_ids = set(removed)
+                ORDERED[s_class] = [key for key in ORDERED.get(s_class, [])
+                                    if key[1] not in removed_ids]
+                VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+        if removed:
+            cls.persist()
+        return removed
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with INDEX_LOCK:
+            obj = DATA[s_class].pop(self.id, None)
+            if obj is not None:
+                keys = ORDERED.get(s_class, [])
+                i = bisect_left(keys, obj.order_key())
+                if i < len(keys) and keys[i][1] == obj.id:
+                    del keys[i]
+                VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+        if obj is not None:
+            self.__class__.persist()
+
+    def order_key(self) -> tuple:
+        """ (created_at, id) key of the object in the ordered index,
+        at the second precision of the file so it survives a reload
+        """
+        return self.created_at.replace(microsecond=0), self.id
 
     @classmethod
     def count(cls) -> int:
@@ -114,6 +237,23 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, after: Optional[tuple] = None,
+             limit: int = 100) -> Tuple[List[TypeVar('Base')],
+                                        Optional[tuple]]:
+        """ Return up to limit objects ordered by (created_at, id)
+        following the key after, and the key of the last returned
+        object if there are more (None otherwise)
+        """
+        s_class = cls.__name__
+        with INDEX_LOCK:
+            keys = ORDERED.get(s_class, [])
+            start = bisect_right(keys, after) if after is not None else 0
+            keys = keys[start:start + limit + 1]
+        next_key = keys[limit - 1] if len(keys) > limit else None
+        objs = DATA[s_class]
+        return [objs[k[1]] for k in keys[:limit] if k[1] in objs], next_key
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
@@ -135,3 +275,11 @@ class Base():
             return True
         
         return list(filter(_search, DATA[s_class].values()))
+
+
+@atexit.register
+def flush_all():
+    """ Write every pending batched change before exiting
+    """
+    for cls in list(PENDING_FLUSHES):
+        cls.flush()
@@ -2,12 +2,15 @@
 """ User module
 """
 import hashlib
+import weakref
 from models.base import Base
+from typing import Callable, List
 
 
 class User(Base):
     """ User class
     """
+    credentials_listeners: List[Callable[[], Callable[[str], None]]] = []
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
@@ -32,6 +35,52 @@ class User(Base):
             self._password = None
         else:
             self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+        self.credentials_changed()
+
+    def save(self):
+        """ Save current object and notify the credentials listeners
+        """
+        super().save()
+        self.credentials_changed()
+
+    @classmethod
+    def save_many(cls, users: List['User']):
+        """ Save several users with a single write to file
+        and notify the credentials listeners
+        """
+        super().save_many(users)
+        for user in users:
+            user.credentials_changed()
+
+    @classmethod
+    def add_credentials_listener(cls, listener: Callable[[str], None]):
+        """ Register a listener called with the email of the users
+        whose credentials change. Bound methods are held weakly, so the
+        listener goes away with its object
+        """
+        if hasattr(listener, '__self__'):
+            ref = weakref.WeakMethod(listener)
+        else:
+            def ref():
+                return listener
+        cls.credentials_listeners.append(ref)
+
+    def credentials_changed(self):
+        """ Notify the listeners that the credentials of this email
+        may have changed (user created or new password)
+        """
+        email = getattr(self, 'email', None)
+        if email is None:
+            return
+        for ref in list(self.credentials_listeners):
+            listener = ref()
+            if listener is not None:
+                listener(email)
+                continue
+            try:
+                self.credentials_listeners.remove(ref)
+            except ValueError:
+                pass
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
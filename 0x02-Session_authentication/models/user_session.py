@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+""" UserSession module
+"""
+from models.base import Base
+from os import getenv
+
+
+class UserSession(Base):
+    """ UserSession class: a session persisted to file.
+    The session ID is also the object ID, so lookups are a dict access.
+    Writes are batched every SESSION_FLUSH_DELAY seconds.
+    """
+    flush_delay = float(getenv('SESSION_FLUSH_DELAY', '1'))
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Initialize a UserSession instance
+        """
+        if kwargs.get('id') is None and kwargs.get('session_id'):
+            kwargs['id'] = kwargs.get('session_id')
+        super().__init__(*args, **kwargs)
+        self.user_id = kwargs.get('user_id')
+        self.session_id = kwargs.get('session_id')
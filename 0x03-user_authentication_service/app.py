@@ -4,10 +4,31 @@ Flask app
 """
 from flask import Flask, jsonify, request, abort, redirect, url_for, Response
 from auth import Auth
+from password_pool import PasswordPoolBusy
 from typing import Union
 
 app = Flask(__name__)
 AUTH = Auth()
+AUTH.start_sweeper()
+
+
+@app.teardown_appcontext
+def close_db_session(exception=None) -> None:
+    """
+    Release the DB session of the request thread.
+    """
+    AUTH.close_session()
+
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error) -> tuple:
+    """
+    Too many logins or registrations are hashing passwords,
+    ask the client to retry shortly.
+    """
+    res = jsonify({"message": "service busy, retry later"})
+    res.headers['Retry-After'] = '1'
+    return res, 503
 
 
 @app.route('/', strict_slashes=False)
@@ -60,7 +81,7 @@ def logout() -> Response:
     user = AUTH.get_user_from_session_id(session_id)
     if not user:
         abort(403)
-    AUTH.destroy_session(user.id)
+    AUTH.destroy_session(user.id, session_id)
     return redirect(url_for('home'))
 
 
@@ -108,5 +129,13 @@ def update_password() -> tuple:
         abort(403)
 
 
+@app.route('/stats', strict_slashes=False)
+def stats() -> str:
+    """
+    Counters of the authentication service.
+    """
+    return jsonify(AUTH.stats())
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port="5000")
+    app.run(host="0.0.0.0", port="5000", threaded=True)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Quart app, the asyncio counterpart of app.py with the same routes.
+One process serves many concurrent connections:
+
+    hypercorn async_app:app --bind 0.0.0.0:5000
+
+Needs quart, hypercorn and aiosqlite, see requirements.txt.
+"""
+from quart import Quart, jsonify, request, abort, redirect, url_for
+from async_auth import AsyncAuth
+from password_pool import PasswordPoolBusy
+from typing import Union
+
+app = Quart(__name__)
+AUTH = AsyncAuth()
+
+
+@app.before_serving
+async def open_db() -> None:
+    """
+    Create the tables and start the sweeper before the first request.
+    """
+    await AUTH.create_all()
+
+
+@app.after_serving
+async def close_db() -> None:
+    """
+    Stop the sweeper and close the database connections.
+    """
+    await AUTH.close()
+
+
+@app.errorhandler(PasswordPoolBusy)
+async def password_pool_busy(error) -> tuple:
+    """
+    Too many logins or registrations are hashing passwords,
+    ask the client to retry shortly.
+    """
+    res = jsonify({"message": "service busy, retry later"})
+    res.headers['Retry-After'] = '1'
+    return res, 503
+
+
+@app.route('/', strict_slashes=False)
+async def home() -> str:
+    """
+    Home route
+    """
+    return jsonify({"message": "Bienvenue"})
+
+
+@app.route('/users', methods=['POST'], strict_slashes=False)
+async def register() -> Union[str, tuple]:
+    """
+    Register user route
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+    try:
+        await AUTH.register_user(email, password)
+        return jsonify({"email": email, "message": "user created"})
+    except ValueError:
+        return jsonify({"message": "email already registered"}), 400
+
+
+@app.route('/sessions', methods=['POST'], strict_slashes=False)
+async def login() -> str:
+    """
+    Log in and set the session_id cookie.
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+    if not await AUTH.valid_login(email, password):
+        abort(401)
+    session_id = await AUTH.create_session(email)
+    res = jsonify({"email": email, "message": "logged in"})
+    res.set_cookie('session_id', session_id)
+    return res
+
+
+@app.route('/sessions', methods=['DELETE'], strict_slashes=False)
+async def logout():
+    """
+    Delete the session_id.
+    """
+    session_id = request.cookies.get('session_id')
+    user = await AUTH.get_user_from_session_id(session_id)
+    if not user:
+        abort(403)
+    await AUTH.destroy_session(user.id, session_id)
+    return redirect(url_for('home'))
+
+
+@app.route('/profile', strict_slashes=False)
+async def profile() -> tuple:
+    """
+    Get user profile.
+    """
+    user = await AUTH.get_user_from_session_id(
+        request.cookies.get('session_id'))
+    if not user:
+        abort(403)
+    return jsonify({"email": user.email}), 200
+
+
+@app.route('/reset_password', methods=['POST'], strict_slashes=False)
+async def reset_password() -> tuple:
+    """
+    Send a reset token to the user.
+    """
+    email = (await request.form).get('email')
+    try:
+        token = await AUTH.get_reset_password_token(email)
+        return jsonify({"email": email, "reset_token": token}), 200
+    except ValueError:
+        abort(403)
+
+
+@app.route('/reset_password', methods=['PUT'], strict_slashes=False)
+async def update_password() -> tuple:
+    """
+    Update the password.
+    """
+    form = await request.form
+    email = form.get('email')
+    try:
+        await AUTH.update_password(form.get('reset_token'),
+                                   form.get('new_password'))
+        return jsonify({"email": email, "message": "Password updated"}), 200
+    except ValueError:
+        abort(403)
+
+
+@app.route('/stats', strict_slashes=False)
+async def stats() -> str:
+    """
+    Counters of the authentication service.
+    """
+    return jsonify(AUTH.stats())
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Async authentication, the coroutine counterpart of auth.Auth
+"""
+from async_db import AsyncDB
+from db import session_expiry
+from auth import _expires_in, _generate_uuid, _hash_password
+from auth import _reset_token_live
+from bcrypt import checkpw
+from password_pool import PasswordPool
+from session_cache import SessionCache, UserSnapshot
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.orm.exc import NoResultFound
+from sweeper import Sweeper
+from user import User
+from typing import Dict, List, Union
+import asyncio
+import time
+
+
+class AsyncAuth:
+    """AsyncAuth class to interact with the authentication database
+    from an event loop. bcrypt runs on the password pool, so the loop
+    keeps serving session checks while passwords are hashed.
+    """
+    def __init__(self):
+        self._db = AsyncDB()
+        self._session_cache = SessionCache()
+        self._passwords = PasswordPool()
+        self._sweeper = Sweeper()
+        self._sweeper.add('expired_sessions', self._db.delete_expired_sessions)
+        self._sweeper.add('expired_reset_tokens',
+                          self._db.clear_expired_reset_tokens)
+        self._sweeper_task = None
+        self._db.update_listeners.append(
+            self._session_cache.invalidate_user)
+
+    async def create_all(self) -> None:
+        """
+        Create and migrate the tables and start the sweeper task,
+        before serving.
+        """
+        await self._db.create_all()
+        if self._sweeper_task is None:
+            self._sweeper_task = asyncio.get_running_loop().create_task(
+                self._sweeper.serve())
+
+    async def close(self) -> None:
+        """
+        Stop the sweeper and close the database connections,
+        after serving.
+        """
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        await self._db.close()
+
+    async def register_user(self, email: str, password: str) -> User:
+        """
+        Registers a user in database.
+        Raises:
+            ValueError: User already exists.
+            PasswordPoolBusy: Too many passwords are being hashed.
+        """
+        hashed_password = (await self._passwords.run_async(
+            _hash_password, password)).decode('utf-8')
+        try:
+            return await self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            raise ValueError("User {} already exists".format(email))
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """
+        True if password is the one of the user of email.
+        Raises:
+            PasswordPoolBusy: Too many passwords are being checked.
+        """
+        if not email or not password:
+            return False
+        try:
+            user = await self._db.find_user_by(email=email)
+        except (NoResultFound, InvalidRequestError):
+            return False
+        return await self._passwords.run_async(
+            checkpw, password.encode(), user.hashed_password.encode('utf-8'))
+
+    async def create_session(self, email: str) -> Union[str, None]:
+        """
+        Create a new session for the user of email, None if there is none.
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            return None
+        session_id = _generate_uuid()
+        expires_at = session_expiry()
+        generation = self._session_cache.generation()
+        await self._db.add_session(user.id, session_id, expires_at)
+        self._session_cache.put(session_id, UserSnapshot(user.id, user.email),
+                                _expires_in(expires_at), generation)
+        return session_id
+
+    async def get_user_from_session_id(
+            self, session_id: str) -> Union[UserSnapshot, None]:
+        """
+        The id and email of the user of session_id, None otherwise.
+        Served from the session cache when possible.
+        """
+        if not session_id:
+            return None
+        user = self._session_cache.get(session_id)
+        if user is not None:
+            return user
+        generation = self._session_cache.generation()
+        try:
+            found, expires_at = await self._db.find_session(session_id)
+        except NoResultFound:
+            return None
+        user = UserSnapshot(found.id, found.email)
+        self._session_cache.put(session_id, user, _expires_in(expires_at),
+                                generation)
+        return user
+
+    async def destroy_session(self, user_id: int,
+                              session_id: str = None) -> None:
+        """
+        Revokes the session session_id of user_id, or all of them.
+        """
+        await self._db.delete_sessions(user_id, session_id)
+        if session_id is None:
+            self._session_cache.invalidate_user(user_id)
+        else:
+            self._session_cache.invalidate(session_id)
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """
+        The pending reset token of the user of email, or a new one
+        if it expired.
+        Raises:
+            ValueError: User does not exist.
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            raise ValueError
+        if _reset_token_live(user):
+            return user.reset_token
+        token = _generate_uuid()
+        await self._db.update_user(user.id, reset_token=token,
+                                   reset_token_issued_at=time.time())
+        return token
+
+    async def get_reset_password_tokens(
+            self, emails: List[str]) -> Dict[str, str]:
+        """
+        New reset tokens of the registered emails, set with one
+        executemany.
+        """
+        ids = await self._db.find_users_by_email(emails)
+        tokens = {email: _generate_uuid() for email in ids}
+        await self._db.set_reset_tokens(
+            {ids[email]: token for email, token in tokens.items()},
+            time.time())
+        return tokens
+
+    async def update_password(self, reset_token: str, password: str) -> None:
+        """
+        Set the password of the user of reset_token.
+        Raises:
+            ValueError: If the reset token is invalid or expired.
+            PasswordPoolBusy: Too many passwords are being hashed.
+        """
+        if not reset_token:
+            raise ValueError
+        try:
+            user = await self._db.find_user_by(reset_token=reset_token)
+        except NoResultFound:
+            raise ValueError
+        if not _reset_token_live(user):
+            raise ValueError
+        hashed_password = (await self._passwords.run_async(
+            _hash_password, password)).decode('utf-8')
+        await self._db.update_user(user.id, hashed_password=hashed_password,
+                                   reset_token=None,
+                                   reset_token_issued_at=None)
+
+    def stats(self) -> dict:
+        """
+        Counters of the session cache, the password pool and the sweeper.
+        """
+        return {'session_cache': self._session_cache.stats(),
+                'password_pool': self._passwords.stats(),
+                'sweeper': self._sweeper.stats()}
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Async DB module, on the aiosqlite driver
+"""
+from db import USER_COLUMNS, migrate, _sqlite_pragmas
+from db import delete_expired_sessions, delete_sessions, select_session
+from db import clear_expired_reset_tokens, reset_token_ttl
+from db import set_reset_tokens, sweep_batch_size
+from os import getenv
+from sqlalchemy import event, pool, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+from typing import Callable, Dict, List, Optional, Tuple
+from user import Base, User, UserSession
+import time
+
+
+class AsyncDB:
+    """
+    Async counterpart of DB: the same methods as coroutines.
+    Each call runs in its own short AsyncSession, so concurrent
+    requests never share one.
+    """
+
+    def __init__(self, url: str = None, echo: bool = None) -> None:
+        """
+        Initialize a new AsyncDB instance.
+            url: DB_URL, "sqlite:///a.db" if unset. sqlite URLs are
+                 switched to the sqlite+aiosqlite driver.
+            echo: DB_ECHO=1 logs every SQL statement, off by default.
+        Call create_all before the first query.
+        """
+        if url is None:
+            url = getenv('DB_URL', 'sqlite:///a.db')
+        if echo is None:
+            echo = getenv('DB_ECHO', '0') == '1'
+        if url.startswith('sqlite:'):
+            url = 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+
+        options = {'echo': echo}
+        if url.startswith('sqlite'):
+            if url.endswith(('://', '/:memory:')):
+                options['poolclass'] = pool.StaticPool
+        self._engine = create_async_engine(url, **options)
+        if self._engine.dialect.name == 'sqlite':
+            event.listen(self._engine.sync_engine, 'connect',
+                         _sqlite_pragmas)
+        self._sessions = sessionmaker(bind=self._engine, class_=AsyncSession,
+                                      expire_on_commit=False)
+        self.update_listeners: List[Callable[[int], None]] = []
+
+    async def create_all(self) -> None:
+        """
+        Create the missing tables and migrate them, see db.migrate.
+        """
+        async with self._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.run_sync(migrate)
+
+    async def close(self) -> None:
+        """
+        Close the connections of the engine.
+        """
+        await self._engine.dispose()
+
+    async def add_user(self, email: str, hashed_password: str) -> User:
+        """
+        Save a new user to the database.
+        Raises:
+            IntegrityError: The email is already registered.
+        """
+        new_user = User(email=email, hashed_password=hashed_password)
+        async with self._sessions() as session:
+            session.add(new_user)
+            await session.commit()
+        return new_user
+
+    async def find_user_by(self, **kwargs) -> User:
+        """
+        First user matching kwargs.
+        Raises:
+            NoResultFound: No user matches.
+            InvalidRequestError: Unknown column.
+        """
+        async with self._sessions() as session:
+            result = await session.execute(
+                select(User).filter_by(**kwargs).limit(1))
+            user = result.scalars().first()
+        if not user:
+            raise NoResultFound("No user found")
+        return user
+
+    async def update_user(self, user_id: int, **kwargs) -> int:
+        """
+        Update the columns of a user with a single UPDATE ... WHERE id = ?
+        Returns:
+            The number of updated rows.
+        Raises:
+            ValueError: Unknown column, no such user or rejected update.
+        """
+        if not USER_COLUMNS.issuperset(kwargs):
+            raise ValueError
+        if not kwargs:
+            try:
+                await self.find_user_by(id=user_id)
+            except NoResultFound:
+                raise ValueError
+            return 0
+        async with self._sessions() as session:
+            try:
+                result = await session.execute(
+                    update(User).where(User.id == user_id).values(**kwargs))
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                raise ValueError
+        if result.rowcount == 0:
+            raise ValueError
+        for listener in self.update_listeners:
+            listener(user_id)
+        return result.rowcount
+
+    async def find_users_by_email(self, emails: List[str]) -> Dict[str, int]:
+        """
+        Ids of the users of emails, 500 emails per SELECT.
+        """
+        emails = list(set(emails))
+        ids = {}
+        async with self._sessions() as session:
+            for i in range(0, len(emails), 500):
+                result = await session.execute(
+                    select(User.email, User.id)
+                    .where(User.email.in_(emails[i:i + 500])))
+                ids.update(result.all())
+        return ids
+
+    async def set_reset_tokens(self, tokens: Dict[int, str],
+                               issued_at: float) -> None:
+        """
+        Set the reset token of many users with one executemany.
+        """
+        if not tokens:
+            return
+        async with self._sessions() as session:
+            await session.execute(set_reset_tokens(), [
+                {'user_id': user_id, 'token': token, 'issued_at': issued_at}
+                for user_id, token in tokens.items()])
+            await session.commit()
+
+    async def clear_expired_reset_tokens(self, batch_size: int = None) -> int:
+        """
+        Clear the expired reset tokens, batch_size rows per statement
+        and transaction.
+        """
+        batch_size = batch_size or sweep_batch_size()
+        issued_before = time.time() - reset_token_ttl()
+        total = 0
+        while True:
+            async with self._sessions() as session:
+                result = await session.execute(
+                    clear_expired_reset_tokens(issued_before, batch_size))
+                await session.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                return total
+
+    async def add_session(self, user_id: int, session_id: str,
+                          expires_at: float = None) -> UserSession:
+        """
+        Save a session of user_id, expiring at the UNIX time expires_at
+        (never if None).
+        """
+        user_session = UserSession(session_id=session_id, user_id=user_id,
+                                   expires_at=expires_at)
+        async with self._sessions() as session:
+            session.add(user_session)
+            await session.commit()
+        return user_session
+
+    async def find_session(
+            self, session_id: str) -> Tuple[User, Optional[float]]:
+        """
+        The user of a live session and the UNIX time it expires at.
+        Raises:
+            NoResultFound: No such session, or expired.
+        """
+        async with self._sessions() as session:
+            result = await session.execute(
+                select_session(session_id, time.time()))
+            row = result.first()
+        if row is None:
+            raise NoResultFound("No session found")
+        return row[0], row[1]
+
+    async def delete_sessions(self, user_id: int,
+                              session_id: str = None) -> int:
+        """
+        Delete one session of user_id, or all of them when session_id
+        is None, with a single DELETE.
+        """
+        async with self._sessions() as session:
+            result = await session.execute(
+                delete_sessions(user_id, session_id))
+            await session.commit()
+        return result.rowcount
+
+    async def delete_expired_sessions(self, batch_size: int = None) -> int:
+        """
+        Delete the expired sessions, batch_size rows per statement
+        and transaction.
+        """
+        batch_size = batch_size or sweep_batch_size()
+        now = time.time()
+        total = 0
+        while True:
+            async with self._sessions() as session:
+                result = await session.execute(
+                    delete_expired_sessions(now, batch_size))
+                await session.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                return total
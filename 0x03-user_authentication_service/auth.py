@@ -4,10 +4,15 @@ This module contains the methods and attributes needed
 for the authentication
 """
 from bcrypt import hashpw, gensalt, checkpw
-from db import DB
+from db import DB, reset_token_ttl, session_expiry
+from password_pool import PasswordPool
+from session_cache import SessionCache, UserSnapshot
+from sweeper import Sweeper
 from user import User
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from typing import Dict, List, Tuple, Union
+import time
 import uuid
 
 
@@ -16,43 +21,83 @@ class Auth:
     """
     def __init__(self):
         self._db = DB()
+        self._session_cache = SessionCache()
+        self._passwords = PasswordPool()
+        self._sweeper = Sweeper()
+        self._sweeper.add('expired_sessions', self._db.delete_expired_sessions)
+        self._sweeper.add('expired_reset_tokens',
+                          self._db.clear_expired_reset_tokens)
+        self._db.update_listeners.append(
+            self._session_cache.invalidate_user)
+
+    def close_session(self) -> None:
+        """
+        Release the DB session of the current thread.
+        """
+        self._db.remove_session()
+
+    def start_sweeper(self) -> None:
+        """
+        Delete the expired sessions and reset tokens in the background,
+        see Sweeper.
+        """
+        self._sweeper.start()
 
     def register_user(self, email: str, password: str) -> User:
         """
         Registers a user in database.
+        The password is hashed first on the password pool, then a single
+        INSERT relies on the unique email index to reject registered
+        emails.
         Args:
             email: A non-nullable string.
             password: A non-nullable string.
         Raises:
             ValueError: User already exists.
+            PasswordPoolBusy: Too many passwords are being hashed.
         Returns:
             User: User object.
         """
+        hashed_password = self._passwords.run(
+            _hash_password, password).decode('utf-8')
         try:
-            users_found = self._db.find_user_by(email=email)
-            if users_found:
-                raise ValueError("User {} already exists".format(email))
-        except NoResultFound:
-            hashed_password = _hash_password(password).decode('utf-8')
-            user = self._db.add_user(email, hashed_password)
-            return user
+            return self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            raise ValueError("User {} already exists".format(email))
+
+    def register_users(self,
+                       users: List[Tuple[str, str]]) -> List[bool]:
+        """
+        Registers many users with a single executemany.
+        Args:
+            users: (email, password) pairs.
+        Returns:
+            list: For each pair, True if the user was created,
+                  False if the email was already registered.
+        """
+        hashed = [(email, _hash_password(password).decode('utf-8'))
+                  for email, password in users]
+        return self._db.add_users(hashed)
 
     def valid_login(self, email: str, password: str) -> bool:
         """
         Login method.
+        The password is checked on the password pool.
         Args:
             email: A non-nullable string.
             password: A non-nullable string.
         Returns:
             bool: True if login, False otherwise.
+        Raises:
+            PasswordPoolBusy: Too many passwords are being checked.
         """
         if not email or not password:
             return False
         try:
             users_found = self._db.find_user_by(email=email)
             hashed_password = users_found.hashed_password
-            return checkpw(password.encode(),
-                           hashed_password.encode('utf-8'))
+            return self._passwords.run(checkpw, password.encode(),
+                                       hashed_password.encode('utf-8'))
         except (NoResultFound, InvalidRequestError):
             return False
 
@@ -60,6 +105,9 @@ class Auth:
         """
         Create Session.
         Takes an email string argument and returns the session ID as a string.
+        The session is a new row of the sessions table, so the other
+        sessions of the user stay valid. It expires after SESSION_TTL
+        seconds, see db.session_expiry.
         Args:
             email: A non-nullable string.
         Returns:
@@ -67,47 +115,73 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(email=email)
-            session_id = _generate_uuid()
-            self._db.update_user(user.id, session_id=session_id)
-            return session_id
-        except (NoResultFound, ValueError):
+        except NoResultFound:
             return None
+        session_id = _generate_uuid()
+        expires_at = session_expiry()
+        generation = self._session_cache.generation()
+        self._db.add_session(user.id, session_id, expires_at)
+        self._session_cache.put(session_id, UserSnapshot(user.id, user.email),
+                                _expires_in(expires_at), generation)
+        return session_id
 
-    def get_user_from_session_id(self, session_id: str) -> Union[User, None]:
+    def get_user_from_session_id(
+            self, session_id: str) -> Union[UserSnapshot, None]:
         """
         Get user from a session id.
         Takes a single session_id string argument
-        and returns the corresponding User or None.
+        and returns the corresponding user or None.
+        Served from the session cache when possible, otherwise with
+        one indexed read of the sessions joined to the users.
         Args:
             session_id: The session id.
         Returns:
-            User: The user object, None otherwise.
+            UserSnapshot: The id and email of the user, None otherwise.
         """
         if not session_id:
             return None
-        try:
-            user = self._db.find_user_by(session_id=session_id)
+        user = self._session_cache.get(session_id)
+        if user is not None:
             return user
+        generation = self._session_cache.generation()
+        try:
+            found, expires_at = self._db.find_session(session_id)
         except NoResultFound:
             return None
+        user = UserSnapshot(found.id, found.email)
+        self._session_cache.put(session_id, user, _expires_in(expires_at),
+                                generation)
+        return user
 
-    def destroy_session(self, user_id: int) -> None:
+    def stats(self) -> dict:
+        """
+        Counters of the session cache, the password pool and the sweeper.
+        """
+        return {'session_cache': self._session_cache.stats(),
+                'password_pool': self._passwords.stats(),
+                'sweeper': self._sweeper.stats()}
+
+    def destroy_session(self, user_id: int, session_id: str = None) -> None:
         """
         Destroys a session.
-        Takes a single session_id string argument
-        and returns the corresponding User or None.
+        Revokes the session session_id of the user, or all the sessions
+        of the user when session_id is None, with a single DELETE.
         Args:
             user_id: The user id.
+            session_id: The session id.
         """
-        try:
-            self._db.update_user(user_id, session_id=None)
-        except ValueError:
-            pass
+        self._db.delete_sessions(user_id, session_id)
+        if session_id is None:
+            self._session_cache.invalidate_user(user_id)
+        else:
+            self._session_cache.invalidate(session_id)
 
     def get_reset_password_token(self, email: str) -> str:
         """
         Get a reset password.
         Takes an email string argument and returns a string.
+        The token is valid RESET_TOKEN_TTL seconds (900 by default):
+        the pending token is returned until then, a new one after.
         Args:
             email: A non-nullable string.
         Raises:
@@ -117,13 +191,32 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(email=email)
-            if user.reset_token:
-                return user.reset_token
-            token = _generate_uuid()
-            self._db.update_user(user.id, reset_token=token)
-            return token
         except NoResultFound:
             raise ValueError
+        if _reset_token_live(user):
+            return user.reset_token
+        token = _generate_uuid()
+        self._db.update_user(user.id, reset_token=token,
+                             reset_token_issued_at=time.time())
+        return token
+
+    def get_reset_password_tokens(self, emails: List[str]) -> Dict[str, str]:
+        """
+        Issue new reset tokens for many users at once (forced rotation):
+        one SELECT per 500 emails, then one executemany UPDATE.
+        Pending tokens are replaced.
+        Args:
+            emails: The emails of the users.
+        Returns:
+            dict: The new token of each registered email, unknown
+                  emails are left out.
+        """
+        ids = self._db.find_users_by_email(emails)
+        tokens = {email: _generate_uuid() for email in ids}
+        self._db.set_reset_tokens(
+            {ids[email]: token for email, token in tokens.items()},
+            time.time())
+        return tokens
 
     def update_password(self, reset_token: str, password: str) -> None:
         """
@@ -136,15 +229,31 @@ class Auth:
         Returns:
             bool: True if password was updated, False otherwise.
         Raises:
-            ValueError: If the reset token is invalid.
+            ValueError: If the reset token is invalid or expired.
+            PasswordPoolBusy: Too many passwords are being hashed.
         """
+        if not reset_token:
+            raise ValueError
         try:
             user = self._db.find_user_by(reset_token=reset_token)
-            hashed_password = _hash_password(password).decode('utf-8')
-            self._db.update_user(user.id, hashed_password=hashed_password,
-                                 reset_token=None)
         except NoResultFound:
             raise ValueError
+        if not _reset_token_live(user):
+            raise ValueError
+        hashed_password = self._passwords.run(
+            _hash_password, password).decode('utf-8')
+        self._db.update_user(user.id, hashed_password=hashed_password,
+                             reset_token=None, reset_token_issued_at=None)
+
+
+def _reset_token_live(user: User) -> bool:
+    """
+    True if the user has a reset token issued less than
+    RESET_TOKEN_TTL seconds ago.
+    """
+    return bool(user.reset_token) and \
+        user.reset_token_issued_at is not None and \
+        user.reset_token_issued_at > time.time() - reset_token_ttl()
 
 
 def _hash_password(password: str) -> bytes:
@@ -158,6 +267,13 @@ def _hash_password(password: str) -> bytes:
     return hashpw(password.encode(), gensalt())
 
 
+def _expires_in(expires_at: Union[float, None]) -> Union[float, None]:
+    """
+    Seconds left before the UNIX time expires_at, None for never.
+    """
+    return None if expires_at is None else expires_at - time.time()
+
+
 def _generate_uuid() -> str:
     """
     Return a string representation of a new UUID.
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the indexed lookups of DB: find_user_by on users and
+find_session on sessions.
+
+Fills a temporary SQLite database with --rows users (1M by default)
+and one live session each, then times lookups by email and
+reset_token with the unique indexes, and again after dropping them,
+and find_session by the primary key of sessions, which can't be
+dropped:
+
+    ./bench_lookup.py --rows 1000000
+"""
+from db import DB
+from sqlalchemy import text
+from typing import Callable, List
+from user import User
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def fill(db: DB, rows: int, batch: int = 50000) -> None:
+    """
+    Inserts rows users and one live session each (session-<i>),
+    with one executemany per batch.
+    """
+    expires_at = time.time() + 86400
+    connection = db._engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, rows, batch):
+            ids = range(start, min(start + batch, rows))
+            cursor.executemany(
+                "INSERT INTO users (id, email, hashed_password, reset_token) "
+                "VALUES (?, ?, ?, ?)",
+                [(i + 1, 'user{}@bench.test'.format(i), 'x',
+                  'reset-{}'.format(i)) for i in ids])
+            cursor.executemany(
+                "INSERT INTO sessions (session_id, user_id, expires_at) "
+                "VALUES (?, ?, ?)",
+                [('session-{}'.format(i), i + 1, expires_at) for i in ids])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def time_lookups(lookup: Callable[[int], object], rows: int,
+                 count: int) -> List[float]:
+    """
+    Sorted durations in microseconds of count lookups of random rows.
+    """
+    durations = []
+    for _ in range(count):
+        i = random.randrange(rows)
+        start = time.perf_counter()
+        lookup(i)
+        durations.append((time.perf_counter() - start) * 1000000)
+    return sorted(durations)
+
+
+def report(label: str, durations: List[float]) -> None:
+    """
+    Prints the p50, p99 and max of durations.
+    """
+    print('{:<28} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+        label, durations[len(durations) // 2],
+        durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+        durations[-1]))
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--scans', type=int, default=20,
+                        help='lookups without indexes (full table scans)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB('sqlite:///' + os.path.join(directory, 'bench.db'))
+        start = time.perf_counter()
+        fill(db, args.rows)
+        print('inserted {} rows in {:.1f} s'.format(
+            args.rows, time.perf_counter() - start))
+        lookups = {
+            'email': lambda i: db.find_user_by(
+                email='user{}@bench.test'.format(i)),
+            'reset_token': lambda i: db.find_user_by(
+                reset_token='reset-{}'.format(i)),
+        }
+
+        print('{:<28} {:>10} {:>10} {:>10}'.format(
+            'lookup (us)', 'p50', 'p99', 'max'))
+        for column, lookup in lookups.items():
+            report('{} indexed'.format(column),
+                   time_lookups(lookup, args.rows, args.lookups))
+        report('find_session', time_lookups(
+            lambda i: db.find_session('session-{}'.format(i)),
+            args.rows, args.lookups))
+
+        with db._engine.begin() as connection:
+            for index in User.__table__.indexes:
+                connection.execute(text('DROP INDEX {}'.format(index.name)))
+        for column, lookup in lookups.items():
+            report('{} full scan'.format(column),
+                   time_lookups(lookup, args.rows, args.scans))
+
+
+if __name__ == "__main__":
+    main()
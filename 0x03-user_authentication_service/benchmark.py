@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the Auth methods at several users table sizes.
+
+For each size, fills a temporary SQLite database (or an in-memory one
+with --memory) with users, sessions and reset tokens, then times each
+Auth method and reports its ops/sec and latency percentiles, with the
+time spent in bcrypt apart from the rest (DB and Python). Each run is
+saved as JSON, and --compare flags the regressions against a baseline:
+
+    ./benchmark.py --sizes 1000,10000,100000 --output run.json
+    ./benchmark.py --compare benchmark_baseline.json run.json
+
+Changes to DB (indexes, queries, session handling) should come with
+the comparison against benchmark_baseline.json, and a new baseline
+when they change the numbers on purpose.
+"""
+from auth import Auth, _hash_password
+from session_cache import SessionCache
+from typing import Callable, Dict, List
+import argparse
+import auth as auth_module
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+PASSWORD = 'benchmark'
+BULK_SIZE = 100
+BULK_REGISTER_SIZE = 5
+
+
+def fill(auth: Auth, size: int, hashed_password: str,
+         batch: int = 50000) -> None:
+    """
+    Inserts size users, one live session each (session-<i>) and a
+    reset token (reset-<i>) for the even users, with executemany.
+    The odd users are the ones reset tokens are issued for, so the
+    tokens of the even users stay valid for update_password.
+    """
+    expires_at = time.time() + 86400
+    connection = auth._db._engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, size, batch):
+            ids = range(start, min(start + batch, size))
+            cursor.executemany(
+                "INSERT INTO users (id, email, hashed_password, reset_token, "
+                "reset_token_issued_at) VALUES (?, ?, ?, ?, ?)",
+                [(i + 1, 'user{}@bench.test'.format(i), hashed_password,
+                  'reset-{}'.format(i) if i % 2 == 0 else None,
+                  time.time() if i % 2 == 0 else None) for i in ids])
+            cursor.executemany(
+                "INSERT INTO sessions (session_id, user_id, expires_at) "
+                "VALUES (?, ?, ?)",
+                [('session-{}'.format(i), i + 1, expires_at) for i in ids])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+class BcryptTimer:
+    """
+    Wraps the password pool of an Auth, and the hashing of the
+    passwords that don't go through it (register_users), to add up
+    the time spent hashing and checking passwords.
+    """
+    def __init__(self, auth: Auth):
+        """
+        Replaces auth._passwords.run and auth._hash_password by timed
+        versions, until restore.
+        """
+        self.seconds = 0.0
+        self._timing = False
+        self._hash_password = auth_module._hash_password
+        auth._passwords.run = self.timed(auth._passwords.run)
+        auth_module._hash_password = self.timed(self._hash_password)
+
+    def timed(self, function: Callable) -> Callable:
+        """
+        function adding its duration to seconds, unless called from
+        another timed function.
+        """
+        def call(*args):
+            if self._timing:
+                return function(*args)
+            self._timing = True
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.seconds += time.perf_counter() - start
+                self._timing = False
+        return call
+
+    def restore(self) -> None:
+        """
+        Puts back the original auth._hash_password.
+        """
+        auth_module._hash_password = self._hash_password
+
+
+def measure(call: Callable[[int], object], picks: List[int],
+            bcrypt: BcryptTimer) -> Dict:
+    """
+    Calls call once per pick and summarizes the durations.
+    """
+    durations = []
+    bcrypt_total = 0.0
+    start_all = time.perf_counter()
+    for i in picks:
+        bcrypt.seconds = 0.0
+        start = time.perf_counter()
+        call(i)
+        durations.append(time.perf_counter() - start)
+        bcrypt_total += bcrypt.seconds
+    elapsed = time.perf_counter() - start_all
+    durations.sort()
+    count = len(durations)
+    total = sum(durations)
+    return {
+        'ops': count,
+        'ops_per_sec': count / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(durations, 0.5),
+        'p90_ms': percentile(durations, 0.9),
+        'p99_ms': percentile(durations, 0.99),
+        'bcrypt_ms': bcrypt_total * 1000 / count,
+        'db_ms': (total - bcrypt_total) * 1000 / count,
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Percentile p of sorted values, in milliseconds.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))] * 1000
+
+
+def bench_size(size: int, args: argparse.Namespace,
+               hashed_password: str) -> Dict[str, Dict]:
+    """
+    Times every Auth method on a database of size users.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if args.memory:
+            os.environ['DB_URL'] = 'sqlite://'
+        else:
+            os.environ['DB_URL'] = 'sqlite:///' + os.path.join(
+                directory, 'bench.db')
+        auth = Auth()
+        fill(auth, size, hashed_password)
+        bcrypt = BcryptTimer(auth)
+        users = list(range(size))
+        random.shuffle(users)
+        even = [i for i in users if i % 2 == 0]
+        odd = [i for i in users if i % 2 == 1]
+        ops = args.ops
+        password_ops = args.password_ops
+        cached = SessionCache()
+        uncached = SessionCache(max_size=0)
+
+        def session_lookup(cache: SessionCache) -> Callable[[int], object]:
+            def call(i):
+                auth._session_cache = cache
+                return auth.get_user_from_session_id('session-{}'.format(i))
+            return call
+
+        for i in range(min(size, 100)):
+            session_lookup(cached)(i)
+
+        def email(i: int) -> str:
+            return 'user{}@bench.test'.format(i)
+
+        benchmarks = [
+            ('get_user_from_session_id', session_lookup(uncached),
+             [random.randrange(size) for _ in range(ops)]),
+            ('get_user_from_session_id cached', session_lookup(cached),
+             [random.randrange(min(size, 100)) for _ in range(ops)]),
+            ('create_session', lambda i: auth.create_session(email(i)),
+             [random.randrange(size) for _ in range(ops)]),
+            ('destroy_session', lambda i: auth.destroy_session(
+                i + 1, 'session-{}'.format(i)), users[:ops]),
+            ('get_reset_password_token',
+             lambda i: auth.get_reset_password_token(email(i)), odd[:ops]),
+            ('get_reset_password_tokens x{}'.format(BULK_SIZE),
+             lambda i: auth.get_reset_password_tokens(
+                 [email(random.choice(odd)) for _ in range(BULK_SIZE)]),
+             list(range(max(1, ops // BULK_SIZE)))),
+            ('valid_login', lambda i: auth.valid_login(email(i), PASSWORD),
+             [random.randrange(size) for _ in range(password_ops)]),
+            ('register_user', lambda i: auth.register_user(
+                'new{}@bench.test'.format(i), PASSWORD),
+             list(range(password_ops))),
+            ('register_users x{}'.format(BULK_REGISTER_SIZE),
+             lambda i: auth.register_users(
+                 [('bulk{}-{}@bench.test'.format(i, j), PASSWORD)
+                  for j in range(BULK_REGISTER_SIZE)]),
+             list(range(max(1, password_ops // BULK_REGISTER_SIZE)))),
+            ('update_password', lambda i: auth.update_password(
+                'reset-{}'.format(i), PASSWORD), even[:password_ops]),
+        ]
+        results = {}
+        for name, call, picks in benchmarks:
+            results[name] = measure(call, picks, bcrypt)
+        bcrypt.restore()
+        auth.close_session()
+        auth._db._engine.dispose()
+        return results
+
+
+def print_results(results: Dict[str, Dict[str, Dict]]) -> None:
+    """
+    Prints the results of each size as a table.
+    """
+    for size, methods in results.items():
+        print('{} users'.format(size))
+        print('  {:<36} {:>6} {:>10} {:>9} {:>9} {:>9} {:>10} {:>8}'.format(
+            'method', 'ops', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms',
+            'bcrypt ms', 'db ms'))
+        for name, row in methods.items():
+            print('  {:<36} {ops:>6} {ops_per_sec:>10.1f} {p50_ms:>9.3f} '
+                  '{p90_ms:>9.3f} {p99_ms:>9.3f} {bcrypt_ms:>10.3f} '
+                  '{db_ms:>8.3f}'.format(name, **row))
+
+
+def compare(baseline_path: str, run_path: str, threshold: float) -> int:
+    """
+    Prints the change of each method between two saved runs and flags
+    the regressions: DB time (bcrypt excluded, it only depends on the
+    machine) higher than the baseline by more than threshold (a
+    fraction). Returns the regression count.
+    """
+    runs = []
+    for path in (baseline_path, run_path):
+        with open(path) as f:
+            runs.append(json.load(f)['results'])
+    baseline, run = runs
+    regressions = 0
+    print('{:<8} {:<36} {:>12} {:>12} {:>9} {:>9}'.format(
+        'users', 'method', 'base ops/s', 'ops/s', 'db ms', 'db change'))
+    for size, methods in run.items():
+        for name, row in methods.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            change = row['db_ms'] / base['db_ms'] - 1 if base['db_ms'] \
+                else 0.0
+            flag = 'REGRESSION' if change > threshold else ''
+            regressions += bool(flag)
+            print('{:<8} {:<36} {:>12.1f} {:>12.1f} {:>9.3f} {:>+8.0%} '
+                  '{}'.format(size, name, base['ops_per_sec'],
+                              row['ops_per_sec'], row['db_ms'], change,
+                              flag))
+    return regressions
+
+
+def main() -> None:
+    """
+    Runs the benchmark or compares two saved runs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated users table sizes')
+    parser.add_argument('--ops', type=int, default=2000,
+                        help='calls per method without bcrypt')
+    parser.add_argument('--password-ops', type=int, default=20,
+                        help='calls per method hashing or checking '
+                             'a password')
+    parser.add_argument('--memory', action='store_true',
+                        help='in-memory database instead of a file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', nargs=2,
+                        metavar=('BASELINE', 'RESULT'))
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change flagged by --compare')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1],
+                              args.threshold)
+        print('{} regression(s)'.format(regressions))
+        sys.exit(1 if regressions else 0)
+
+    random.seed(args.seed)
+    hashed_password = _hash_password(PASSWORD).decode('utf-8')
+    results = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results[str(size)] = bench_size(size, args, hashed_password)
+    print_results(results)
+    if args.output:
+        config = {k: v for k, v in vars(args).items() if k != 'compare'}
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print('saved', args.output)
+
+
+if __name__ == "__main__":
+    main()
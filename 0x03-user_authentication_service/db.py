@@ -2,12 +2,105 @@
 """
 DB module
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from os import getenv
+from sqlalchemy import bindparam, create_engine, delete, event, inspect
+from sqlalchemy import or_, pool, select, text, update
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
-from user import Base, User
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from user import Base, User, UserSession
+import time
+
+
+USER_COLUMNS = frozenset(User.__table__.columns.keys())
+
+
+def session_expiry(now: float = None) -> Optional[float]:
+    """
+    UNIX time a session created at now (the current time by default)
+    expires at: SESSION_TTL seconds later, 86400 if unset.
+    None when SESSION_TTL <= 0, the sessions never expire.
+    """
+    ttl = float(getenv('SESSION_TTL', '86400'))
+    if ttl <= 0:
+        return None
+    return (time.time() if now is None else now) + ttl
+
+
+def select_session(session_id: str, now: float):
+    """
+    SELECT of the user and expiry of a live session: one lookup
+    of the sessions primary key joined to the users primary key.
+    """
+    return select(User, UserSession.expires_at)\
+        .join(UserSession, UserSession.user_id == User.id)\
+        .where(UserSession.session_id == session_id,
+               or_(UserSession.expires_at.is_(None),
+                   UserSession.expires_at > now))
+
+
+def delete_sessions(user_id: int, session_id: str = None):
+    """
+    DELETE of one session of a user, or all of them.
+    """
+    statement = delete(UserSession).where(UserSession.user_id == user_id)
+    if session_id is not None:
+        statement = statement.where(UserSession.session_id == session_id)
+    return statement.execution_options(synchronize_session=False)
+
+
+def delete_expired_sessions(now: float, batch_size: int):
+    """
+    DELETE of at most batch_size sessions expired at now, picked
+    with the expires_at index.
+    """
+    return delete(UserSession).where(UserSession.session_id.in_(
+        select(UserSession.session_id)
+        .where(UserSession.expires_at <= now).limit(batch_size)))\
+        .execution_options(synchronize_session=False)
+
+
+def reset_token_ttl() -> float:
+    """
+    Seconds a reset token is valid: RESET_TOKEN_TTL, 900 if unset.
+    """
+    return float(getenv('RESET_TOKEN_TTL', '900'))
+
+
+def set_reset_tokens():
+    """
+    UPDATE setting the reset token of a user, run once per row of
+    {'user_id', 'token', 'issued_at'} parameters.
+    """
+    return update(User.__table__)\
+        .where(User.id == bindparam('user_id'))\
+        .values(reset_token=bindparam('token'),
+                reset_token_issued_at=bindparam('issued_at'))
+
+
+def clear_expired_reset_tokens(issued_before: float, batch_size: int):
+    """
+    UPDATE clearing at most batch_size reset tokens issued before
+    issued_before, picked with the reset_token_issued_at index.
+    """
+    return update(User).where(User.id.in_(
+        select(User.id)
+        .where(User.reset_token_issued_at <= issued_before)
+        .limit(batch_size)))\
+        .values(reset_token=None, reset_token_issued_at=None)\
+        .execution_options(synchronize_session=False)
+
+
+def sweep_batch_size() -> int:
+    """
+    Rows deleted or updated per statement by the sweeper jobs:
+    SWEEP_BATCH_SIZE, 500 if unset. Each batch is its own transaction,
+    so writers wait at most one batch.
+    """
+    return int(getenv('SWEEP_BATCH_SIZE', '500'))
 
 
 class DB:
@@ -15,24 +108,75 @@ class DB:
     DB class
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, echo: bool = None,
+                 poolclass: Union[str, type] = None,
+                 pool_size: int = None) -> None:
         """
-        Initialize a new DB instance
+        Initialize a new DB instance.
+        Each argument defaults to an environment variable:
+            url: DB_URL, "sqlite:///a.db" if unset.
+            echo: DB_ECHO=1 logs every SQL statement, off by default.
+            poolclass: DB_POOL_CLASS, a sqlalchemy.pool class name.
+            pool_size: DB_POOL_SIZE (10 for SQLite files by default).
+        SQLite connections use WAL, synchronous=NORMAL and a busy
+        timeout of DB_BUSY_TIMEOUT milliseconds (5000 by default).
+        SQLite files use a QueuePool shared by the threads, in-memory
+        SQLite a single StaticPool connection so every thread sees
+        the same database.
+        Each thread gets its own session, see _session.
+        update_listeners are called with the user id after each
+        update_user, so caches of users can drop it.
+        The tables are created if missing and migrated (see migrate),
+        existing data is kept.
         """
-        self._engine = create_engine("sqlite:///a.db", echo=True)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+        if url is None:
+            url = getenv('DB_URL', 'sqlite:///a.db')
+        if echo is None:
+            echo = getenv('DB_ECHO', '0') == '1'
+        if poolclass is None:
+            poolclass = getenv('DB_POOL_CLASS')
+        if pool_size is None and getenv('DB_POOL_SIZE'):
+            pool_size = int(getenv('DB_POOL_SIZE'))
+
+        options = {'echo': echo}
+        if url.startswith('sqlite'):
+            options['connect_args'] = {'check_same_thread': False}
+            if url in ('sqlite://', 'sqlite:///:memory:'):
+                poolclass = poolclass or pool.StaticPool
+            else:
+                poolclass = poolclass or pool.QueuePool
+                pool_size = pool_size or 10
+        if isinstance(poolclass, str):
+            poolclass = getattr(pool, poolclass)
+        if poolclass:
+            options['poolclass'] = poolclass
+        if pool_size and (poolclass is None or
+                          issubclass(poolclass, pool.QueuePool)):
+            options['pool_size'] = pool_size
+            options['max_overflow'] = int(getenv('DB_MAX_OVERFLOW', '10'))
+        self._engine = create_engine(url, **options)
+        if self._engine.dialect.name == 'sqlite':
+            event.listen(self._engine, 'connect', _sqlite_pragmas)
+        with self._engine.begin() as connection:
+            Base.metadata.create_all(connection)
+            migrate(connection)
+        self._sessions = scoped_session(sessionmaker(
+            bind=self._engine, expire_on_commit=False))
+        self.update_listeners: List[Callable[[int], None]] = []
 
     @property
     def _session(self) -> Session:
         """
-        Memoized session object
+        Session of the current thread, from the scoped registry
+        """
+        return self._sessions()
+
+    def remove_session(self) -> None:
+        """
+        Close the session of the current thread, the next use of
+        _session opens a new one.
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        self._sessions.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -43,12 +187,58 @@ class DB:
             hashed_password: A non-nullable string.
         Returns:
             User object.
+        Raises:
+            IntegrityError: The email is already registered.
         """
         new_user = User(email=email, hashed_password=hashed_password)
         self._session.add(new_user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
         return new_user
 
+    def add_users(self, users: List[Tuple[str, str]]) -> List[bool]:
+        """
+        Insert many users with a single executemany.
+        Emails already registered (or repeated in users) are skipped.
+        Arguments:
+            users: (email, hashed_password) pairs.
+        Returns:
+            For each pair, True if the user was created.
+        """
+        if not users:
+            return []
+        session = self._session
+        rows = [{'email': email, 'hashed_password': hashed_password}
+                for email, hashed_password in users]
+        insert = User.__table__.insert().prefix_with('OR IGNORE',
+                                                     dialect='sqlite')
+        try:
+            session.execute(insert, rows)
+        except IntegrityError:
+            # Other dialects reject the whole batch on a duplicate
+            session.rollback()
+            for row in rows:
+                try:
+                    with session.begin_nested():
+                        session.execute(User.__table__.insert(), row)
+                except IntegrityError:
+                    pass
+        emails = list({email for email, _ in users})
+        stored = {}
+        for i in range(0, len(emails), 500):
+            stored.update(session.query(User.email, User.hashed_password)
+                          .filter(User.email.in_(emails[i:i + 500])))
+        session.commit()
+        created = []
+        for email, hashed_password in users:
+            created.append(stored.get(email) == hashed_password)
+            if created[-1]:
+                stored.pop(email)
+        return created
+
     def find_user_by(self, **kwargs) -> User:
         """
         Implement the DB.find_user_by method.
@@ -65,21 +255,234 @@ class DB:
             raise NoResultFound("No user found")
         return user
 
-    def update_user(self, user_id: int, **kwargs) -> None:
+    def update_user(self, user_id: int, **kwargs) -> int:
         """
         Implement the DB.update_user method
         that takes as argument a required user_id integer
-        and arbitrary keyword arguments, and returns None.
+        and arbitrary keyword arguments.
+        The keys are checked against the users columns, then a single
+        UPDATE ... WHERE id = ? is issued (no SELECT of the user).
         Arguments:
             user_id - the given user id
+        Returns:
+            The number of updated rows.
+        Raises:
+            ValueError: Unknown column, no such user or rejected update.
         """
+        if not USER_COLUMNS.issuperset(kwargs):
+            raise ValueError
+        if not kwargs:
+            try:
+                self.find_user_by(id=user_id)
+            except NoResultFound:
+                raise ValueError
+            return 0
         try:
-            user = self.find_user_by(id=user_id)
-            for key, value in kwargs.items():
-                if hasattr(user, key):
-                    setattr(user, key, value)
-                else:
-                    raise InvalidRequestError
+            count = self._session.query(User).filter(User.id == user_id)\
+                .update(kwargs, synchronize_session='evaluate')
             self._session.commit()
-        except (NoResultFound, InvalidRequestError, ValueError):
+        except (InvalidRequestError, IntegrityError):
+            self._session.rollback()
+            raise ValueError
+        if count == 0:
             raise ValueError
+        for listener in self.update_listeners:
+            listener(user_id)
+        return count
+
+    def find_users_by_email(self, emails: List[str]) -> Dict[str, int]:
+        """
+        Ids of the users of emails, 500 emails per SELECT.
+        Returns:
+            The id of each registered email.
+        """
+        emails = list(set(emails))
+        ids = {}
+        for i in range(0, len(emails), 500):
+            ids.update(self._session.query(User.email, User.id)
+                       .filter(User.email.in_(emails[i:i + 500])))
+        self._session.commit()
+        return ids
+
+    def set_reset_tokens(self, tokens: Dict[int, str],
+                         issued_at: float) -> None:
+        """
+        Set the reset token of many users with one executemany.
+        Arguments:
+            tokens: The new token of each user id.
+            issued_at: UNIX time the tokens are issued at.
+        """
+        if not tokens:
+            return
+        self._session.execute(set_reset_tokens(), [
+            {'user_id': user_id, 'token': token, 'issued_at': issued_at}
+            for user_id, token in tokens.items()])
+        self._session.commit()
+
+    def clear_expired_reset_tokens(self, batch_size: int = None) -> int:
+        """
+        Clear the reset tokens older than reset_token_ttl(),
+        batch_size (sweep_batch_size()) rows per statement and
+        transaction.
+        Returns:
+            The number of cleared tokens.
+        """
+        batch_size = batch_size or sweep_batch_size()
+        issued_before = time.time() - reset_token_ttl()
+        total = 0
+        while True:
+            count = self._session.execute(
+                clear_expired_reset_tokens(issued_before, batch_size)).rowcount
+            self._session.commit()
+            total += count
+            if count < batch_size:
+                return total
+
+    def add_session(self, user_id: int, session_id: str,
+                    expires_at: float = None) -> UserSession:
+        """
+        Save a session of user_id, expiring at the UNIX time expires_at
+        (never if None).
+        """
+        user_session = UserSession(session_id=session_id, user_id=user_id,
+                                   expires_at=expires_at)
+        self._session.add(user_session)
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
+        return user_session
+
+    def find_session(self, session_id: str) -> Tuple[User, Optional[float]]:
+        """
+        The user of a live session and the UNIX time it expires at.
+        Raises:
+            NoResultFound: No such session, or expired.
+        """
+        row = self._session.execute(
+            select_session(session_id, time.time())).first()
+        self._session.commit()
+        if row is None:
+            raise NoResultFound("No session found")
+        return row[0], row[1]
+
+    def delete_sessions(self, user_id: int, session_id: str = None) -> int:
+        """
+        Delete the session session_id of user_id, or every session
+        of user_id when session_id is None, with a single DELETE.
+        Returns:
+            The number of deleted sessions.
+        """
+        count = self._session.execute(
+            delete_sessions(user_id, session_id)).rowcount
+        self._session.commit()
+        return count
+
+    def delete_expired_sessions(self, batch_size: int = None) -> int:
+        """
+        Delete the expired sessions, batch_size (sweep_batch_size())
+        rows per statement and transaction.
+        Returns:
+            The number of deleted sessions.
+        """
+        batch_size = batch_size or sweep_batch_size()
+        now = time.time()
+        total = 0
+        while True:
+            count = self._session.execute(
+                delete_expired_sessions(now, batch_size)).rowcount
+            self._session.commit()
+            total += count
+            if count < batch_size:
+                return total
+
+
+def _rebuild(connection, table, columns: Dict[str, dict]) -> None:
+    """
+    Rebuild table to its current definition, keeping the values of the
+    existing columns. Follows the order documented by SQLite (create
+    the new table, copy, drop the old one, rename the new one), so the
+    foreign keys of other tables still point to table. The indexes are
+    created afterwards by migrate.
+    """
+    names = ', '.join(c.name for c in table.columns if c.name in columns)
+    create = str(CreateTable(table).compile(connection)).replace(
+        'CREATE TABLE {} ('.format(table.name),
+        'CREATE TABLE {}_new ('.format(table.name), 1)
+    connection.execute(text(create))
+    connection.execute(text(
+        "INSERT INTO {0}_new ({1}) SELECT {1} FROM {0}".format(
+            table.name, names)))
+    connection.execute(text("DROP TABLE {}".format(table.name)))
+    connection.execute(text(
+        "ALTER TABLE {0}_new RENAME TO {0}".format(table.name)))
+
+
+def migrate(connection) -> None:
+    """
+    Bring tables created by an older version up to date:
+    - rebuild users if session_id or reset_token are still NOT NULL,
+    - rebuild sessions if its foreign key lost track of users,
+    - add users.reset_token_issued_at, pending tokens are considered
+      issued now,
+    - create the missing indexes of users and sessions,
+    - move the sessions still in users.session_id to sessions.
+    Runs in the transaction of connection.
+    Raises IntegrityError if existing rows have duplicate values.
+    """
+    inspector = inspect(connection)
+    table = User.__table__
+    columns = {c['name']: c for c in inspector.get_columns(table.name)}
+    if not columns['session_id']['nullable'] or \
+            not columns['reset_token']['nullable']:
+        _rebuild(connection, table, columns)
+        inspector = inspect(connection)
+    elif 'reset_token_issued_at' not in columns:
+        connection.execute(text(
+            "ALTER TABLE users ADD COLUMN reset_token_issued_at FLOAT"))
+
+    # Earlier rebuilds renamed users away, which pointed the foreign
+    # key of sessions to the dropped users_old
+    if any(key['referred_table'] != 'users'
+           for key in inspector.get_foreign_keys('sessions')):
+        _rebuild(connection, UserSession.__table__,
+                 {c['name']: c for c in inspector.get_columns('sessions')})
+        inspector = inspect(connection)
+
+    for model in (User, UserSession):
+        table = model.__table__
+        existing = {index['name']
+                    for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+
+    # Reset tokens issued by older versions
+    connection.execute(text(
+        "UPDATE users SET reset_token_issued_at = :now "
+        "WHERE reset_token IS NOT NULL AND reset_token_issued_at IS NULL"),
+        {'now': time.time()})
+
+    # Sessions stored in users.session_id by older versions
+    connection.execute(text(
+        "INSERT INTO sessions (session_id, user_id, expires_at) "
+        "SELECT session_id, id, :expires_at FROM users "
+        "WHERE session_id IS NOT NULL"), {'expires_at': session_expiry()})
+    connection.execute(text(
+        "UPDATE users SET session_id = NULL WHERE session_id IS NOT NULL"))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Tune every new SQLite connection: WAL journal (file databases only),
+    synchronous=NORMAL and a busy timeout.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA busy_timeout = {:d}".format(
+        int(getenv('DB_BUSY_TIMEOUT', '5000'))))
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute("PRAGMA database_list")
+    if cursor.fetchone()[2]:
+        cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.close()
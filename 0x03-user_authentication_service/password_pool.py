@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Bounded pool running the bcrypt hashes off the request threads
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import cpu_count, getenv
+from threading import BoundedSemaphore, Lock
+from typing import Callable
+import asyncio
+import time
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Raised when the queue of the password pool is full.
+    """
+
+
+class PasswordPool:
+    """
+    Thread pool with a bounded queue for the password hashes.
+    bcrypt releases the GIL, so workers hash in parallel; once
+    workers + queue_size hashes are pending, new ones are rejected
+    right away instead of piling up behind the others.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None) -> None:
+        """
+        Initialize the pool.
+        Each argument defaults to an environment variable:
+            workers: PASSWORD_POOL_WORKERS, the number of CPUs if unset.
+            queue_size: PASSWORD_POOL_QUEUE, 4 * workers if unset.
+        """
+        if workers is None:
+            workers = int(getenv('PASSWORD_POOL_WORKERS', '0')) or \
+                cpu_count() or 1
+        if queue_size is None:
+            queue_size = int(getenv('PASSWORD_POOL_QUEUE', str(4 * workers)))
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='bcrypt')
+        self._slots = BoundedSemaphore(workers + queue_size)
+        self._lock = Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, function: Callable, *args) -> Future:
+        """
+        Queue function(*args) on the pool.
+        Raises:
+            PasswordPoolBusy: The queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy
+        try:
+            with self._lock:
+                self.queued += 1
+            return self._executor.submit(self._call, time.perf_counter(),
+                                         function, args)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            self._slots.release()
+            raise
+
+    def run(self, function: Callable, *args):
+        """
+        Run function(*args) on the pool and return its result.
+        Raises:
+            PasswordPoolBusy: The queue is full.
+        """
+        return self.submit(function, *args).result()
+
+    async def run_async(self, function: Callable, *args):
+        """
+        Await function(*args) run on the pool, without blocking
+        the event loop.
+        Raises:
+            PasswordPoolBusy: The queue is full.
+        """
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def _call(self, submitted: float, function: Callable, args: tuple):
+        """
+        Run function on a worker and record the time it waited.
+        """
+        wait = time.perf_counter() - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """
+        Queue depth, rejections and wait times of the pool.
+        """
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_mean_ms': (self.wait_total * 1000 / started
+                                 if started else 0.0),
+                'wait_max_ms': self.wait_max * 1000,
+            }
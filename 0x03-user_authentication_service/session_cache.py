@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+In-process cache of the users of the live sessions
+"""
+from collections import OrderedDict, namedtuple
+from os import getenv
+from threading import Lock
+from typing import Optional
+import time
+
+
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'email'])
+UserSnapshot.__doc__ = """
+The fields of a user the session routes need, detached from the DB.
+"""
+
+
+class SessionCache:
+    """
+    Bounded LRU from a session id to a UserSnapshot.
+    Entries expire ttl seconds after they were cached, which bounds
+    how stale a session revoked by another process can be seen here.
+    Every invalidation bumps a generation: a lookup takes it before
+    reading the DB and passes it to put, which skips the entry if an
+    invalidation ran meanwhile, so a revoked session isn't cached back.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None) -> None:
+        """
+        Initialize the cache.
+        Each argument defaults to an environment variable:
+            max_size: SESSION_CACHE_SIZE, 10000 if unset, 0 disables it.
+            ttl: SESSION_CACHE_TTL in seconds, 60 if unset.
+        """
+        if max_size is None:
+            max_size = int(getenv('SESSION_CACHE_SIZE', '10000'))
+        if ttl is None:
+            ttl = float(getenv('SESSION_CACHE_TTL', '60'))
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str) -> Optional[UserSnapshot]:
+        """
+        Snapshot of the user of session_id, None if not cached
+        or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._drop(session_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self) -> int:
+        """
+        Number of invalidations so far, to pass to put.
+        """
+        return self._generation
+
+    def put(self, session_id: str, user: UserSnapshot,
+            expires_in: Optional[float] = None,
+            generation: Optional[int] = None) -> None:
+        """
+        Cache the user of session_id, evicting the least recently
+        used sessions when full. The entry expires after the cache ttl,
+        or after expires_in seconds when the session expires sooner.
+        Nothing is cached if generation (taken before the DB read) is
+        no longer the current one.
+        """
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._drop(session_id)
+            self._entries[session_id] = (user, time.monotonic() + ttl)
+            self._by_user.setdefault(user.id, set()).add(session_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, session_id: str) -> None:
+        """
+        Forget session_id.
+        """
+        with self._lock:
+            self._generation += 1
+            self._drop(session_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Forget every session of user_id.
+        """
+        with self._lock:
+            self._generation += 1
+            for session_id in self._by_user.pop(user_id, ()):
+                self._entries.pop(session_id, None)
+
+    def _drop(self, session_id: str) -> None:
+        """
+        Remove session_id from the entries and the user index,
+        the lock must be held.
+        """
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            sessions = self._by_user.get(entry[0].id)
+            if sessions is not None:
+                sessions.discard(session_id)
+                if not sessions:
+                    del self._by_user[entry[0].id]
+
+    def stats(self) -> dict:
+        """
+        Size and hit/miss counters of the cache.
+        """
+        return {'size': len(self._entries), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses}
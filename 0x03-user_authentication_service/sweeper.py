@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Periodic cleanup jobs of the authentication database
+"""
+from os import getenv
+from threading import Event, Thread
+from typing import Callable, Dict
+import asyncio
+import time
+
+
+class Sweeper:
+    """
+    Runs cleanup jobs every interval seconds, on a daemon thread
+    (start) or as a task of an event loop (serve). A job returns
+    the number of rows it cleaned; failures are counted and the
+    job runs again next time.
+    """
+
+    def __init__(self, interval: float = None) -> None:
+        """
+        Initialize the sweeper.
+            interval: SWEEP_INTERVAL in seconds, 60 if unset.
+        """
+        if interval is None:
+            interval = float(getenv('SWEEP_INTERVAL', '60'))
+        self.interval = interval
+        self.jobs: Dict[str, Callable] = {}
+        self.cleaned: Dict[str, int] = {}
+        self.errors = 0
+        self.runs = 0
+        self.last_run_ms = 0.0
+        self._stop = None
+
+    def add(self, name: str, job: Callable) -> None:
+        """
+        Register a job: a function, or a coroutine function when served
+        from an event loop.
+        """
+        self.jobs[name] = job
+        self.cleaned.setdefault(name, 0)
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Run every job once and return the rows each cleaned.
+        """
+        start = time.perf_counter()
+        counts = {}
+        for name, job in self.jobs.items():
+            try:
+                counts[name] = job()
+            except Exception:
+                self.errors += 1
+                continue
+            self.cleaned[name] += counts[name]
+        self._ran(start)
+        return counts
+
+    async def run_once_async(self) -> Dict[str, int]:
+        """
+        Await every job once and return the rows each cleaned.
+        """
+        start = time.perf_counter()
+        counts = {}
+        for name, job in self.jobs.items():
+            try:
+                counts[name] = await job()
+            except Exception:
+                self.errors += 1
+                continue
+            self.cleaned[name] += counts[name]
+        self._ran(start)
+        return counts
+
+    def _ran(self, start: float) -> None:
+        """
+        Record a run started at start.
+        """
+        self.runs += 1
+        self.last_run_ms = (time.perf_counter() - start) * 1000
+
+    def start(self) -> None:
+        """
+        Run the jobs every interval seconds on a daemon thread.
+        """
+        if self._stop is not None or self.interval <= 0:
+            return
+        stop = self._stop = Event()
+
+        def run():
+            while not stop.wait(self.interval):
+                self.run_once()
+
+        Thread(target=run, name='sweeper', daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        Stop the sweeper thread.
+        """
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    async def serve(self) -> None:
+        """
+        Await the jobs every interval seconds, until cancelled.
+        """
+        if self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once_async()
+
+    def stats(self) -> dict:
+        """
+        Rows cleaned per job, runs, errors and duration of the last run.
+        """
+        return {'cleaned': dict(self.cleaned), 'runs': self.runs,
+                'errors': self.errors, 'last_run_ms': self.last_run_ms}
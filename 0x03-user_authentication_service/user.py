@@ -3,7 +3,7 @@
 SQLAlchemy model named User for a database table named users.
 """
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Float, ForeignKey, Integer, String
 
 
 Base = declarative_base()
@@ -11,11 +11,33 @@ Base = declarative_base()
 
 class User(Base):
     """
-    Class User
+    Class User.
+    email and reset_token have unique indexes, since the users are
+    looked up by each of them. reset_token is NULL while the user has
+    no pending reset; reset_token_issued_at is the UNIX time it was
+    issued, indexed for the sweeper of expired tokens. session_id is
+    no longer set: the sessions live in the sessions table
+    (UserSession).
     """
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
-    session_id = Column(String(250), nullable=False)
-    reset_token = Column(String(250), nullable=False)
+    session_id = Column(String(250), nullable=True, unique=True, index=True)
+    reset_token = Column(String(250), nullable=True, unique=True,
+                         index=True)
+    reset_token_issued_at = Column(Float, nullable=True, index=True)
+
+
+class UserSession(Base):
+    """
+    Class UserSession, for a database table named sessions.
+    A user has one row per logged in client. expires_at is a UNIX
+    time, NULL for sessions that never expire; it is indexed so the
+    sweeper finds the expired sessions without scanning the table.
+    """
+    __tablename__ = 'sessions'
+    session_id = Column(String(250), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False,
+                     index=True)
+    expires_at = Column(Float, nullable=True, index=True)